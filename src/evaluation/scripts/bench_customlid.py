@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import time
+
+from eval_datasets import batched, dataset_file, iter_jsonl
+from fasttext_predictions import load_language_list
+from glotlid_customlid import CustomLID
+
+
+def measure(name, predict, texts, batch_size):
+    start_time = time.perf_counter()
+    for batch in batched(texts, batch_size):
+        predict(batch)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name}: {len(texts) / elapsed:.1f} texts/sec", file=sys.stderr)
+    return {"seconds": elapsed, "texts_per_sec": len(texts) / elapsed}
+
+
+def bench_customlid(model_path, languages_file, dataset, split, batch_size, limit):
+    dataset_path, text_field = dataset_file(dataset, split)
+    texts = [example[text_field] for example in iter_jsonl(dataset_path)][:limit]
+    languages = load_language_list(languages_file)
+
+    results = {"num_texts": len(texts), "num_languages": len(languages)}
+    for mode in ["before", "after", "script"]:
+        model = CustomLID(model_path, languages=languages, mode=mode)
+        results[f"customlid_{mode}_per_text"] = measure(f"CustomLID {mode}, one text per call",
+                                                         lambda batch: [model.predict(text, k=1) for text in batch], texts, batch_size)
+        results[f"customlid_{mode}_batch"] = measure(f"CustomLID {mode}, batches of {batch_size}",
+                                                      lambda batch: model.predict(batch, k=1), texts, batch_size)
+    results["fasttext_unrestricted_batch"] = measure(f"fastText unrestricted, batches of {batch_size}",
+                                                     lambda batch: model.model.predict(batch, k=1), texts, batch_size)
+    json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare restricted CustomLID prediction with unrestricted fastText")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--languages-file", required=True)
+    parser.add_argument("--dataset", default="flores")
+    parser.add_argument("--split", default="devtest")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first LIMIT texts")
+
+    args = parser.parse_args()
+
+    bench_customlid(args.model_path, args.languages_file, args.dataset, args.split, args.batch_size, args.limit)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import time
+
+import fasttext
+import numpy as np
+from bench_customlid import measure
+from eval_datasets import dataset_file, iter_jsonl
+from fasttext_numpy import FastTextNumpy
+from openlid_normer import normalize_batch
+
+
+def timed_load(name, load, model_path):
+    start_time = time.perf_counter()
+    model = load(model_path)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name}: loaded in {elapsed:.2f}s", file=sys.stderr)
+    return model, elapsed
+
+
+def bench_fasttext_numpy(model_path, dataset, split, enable_preprocessing, batch_size, limit):
+    dataset_path, text_field = dataset_file(dataset, split)
+    texts = [example[text_field] for example in iter_jsonl(dataset_path)][:limit]
+    texts = normalize_batch(texts) if enable_preprocessing else [text.replace("\n", " ") for text in texts]
+
+    binding, binding_load_time = timed_load("fasttext binding", fasttext.load_model, model_path)
+    model, numpy_load_time = timed_load("fasttext_numpy", FastTextNumpy, model_path)
+    # the first pass over the data fills the token cache; the second one shows the steady state
+    results = {
+        "num_texts": len(texts),
+        "load_seconds": {"fasttext": binding_load_time, "numpy": numpy_load_time},
+        "fasttext_sentence_vectors": measure("fasttext get_sentence_vector", lambda batch: np.stack([binding.get_sentence_vector(text) for text in batch]),
+                                             texts, batch_size),
+        "numpy_sentence_vectors": measure("fasttext_numpy get_sentence_vectors, first pass", model.get_sentence_vectors, texts, batch_size),
+        "numpy_sentence_vectors_cached": measure("fasttext_numpy get_sentence_vectors, cached tokens", model.get_sentence_vectors, texts, batch_size),
+        "fasttext_predict": measure("fasttext predict", lambda batch: binding.predict(batch, k=1), texts, batch_size),
+        "numpy_predict": measure("fasttext_numpy predict", lambda batch: model.predict(batch, k=1), texts, batch_size),
+    }
+    json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the throughput of fasttext_numpy with the fasttext binding")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--dataset", default="flores")
+    parser.add_argument("--split", default="devtest")
+    parser.add_argument("--enable-preprocessing", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first LIMIT texts")
+
+    args = parser.parse_args()
+
+    bench_fasttext_numpy(args.model_path, args.dataset, args.split, args.enable_preprocessing, args.batch_size, args.limit)
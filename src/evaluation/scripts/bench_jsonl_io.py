@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import argparse
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+
+from eval_datasets import DATASETS, dataset_file
+from jsonl_io import JsonlWriter, codec_name, iter_jsonl
+
+
+def stdlib_read(path):
+    # what the scripts did before jsonl_io: a text-mode line loop with json.loads
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line.strip()) for line in f]
+
+
+def stdlib_write(path, examples):
+    with open(path, "w", encoding="utf-8") as f:
+        for example in examples:
+            f.write(json.dumps(example, ensure_ascii=False) + "\n")
+
+
+def jsonl_io_read(path):
+    return list(iter_jsonl(path))
+
+
+def jsonl_io_write(path, examples):
+    with JsonlWriter(path) as writer:
+        writer.write_all(examples)
+
+
+def end_to_end(read, write, dataset_path, out_dir):
+    """Read the benchmark, write a predictions file, read it back and write it merged with a second model, as
+    fasttext_predictions.py, evaluate.py and merge_predictions.py do."""
+    examples = read(dataset_path)
+    for example in examples:
+        example["predictions"] = {"model": f"{example.get('iso_639_3', 'und')}_{example.get('iso_15924', 'Zyyy')}"}
+    predictions_path = os.path.join(out_dir, "predictions.jsonl")
+    write(predictions_path, examples)
+    merged = read(predictions_path)
+    for example in merged:
+        example["predictions"]["other"] = example["predictions"]["model"]
+    merged_path = os.path.join(out_dir, "merged.jsonl")
+    write(merged_path, merged)
+    return len(examples), merged_path
+
+
+def benchmark(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    print(f"{name}: {best:.3f}s", file=sys.stderr)
+    return best, result
+
+
+def bench_jsonl_io(dataset, split, repeat):
+    dataset_path, _ = dataset_file(dataset, split)
+    if dataset_path.endswith((".gz", ".zst")):
+        raise ValueError(f"{dataset_path} is compressed; the stdlib baseline reads plain JSONL only")
+    results = {"codec": codec_name(), "dataset": dataset, "split": split}
+    with tempfile.TemporaryDirectory() as stdlib_dir, tempfile.TemporaryDirectory() as jsonl_io_dir:
+        read_seconds, examples = benchmark("stdlib read", lambda: stdlib_read(dataset_path), repeat)
+        fast_read_seconds, fast_examples = benchmark(f"jsonl_io read ({codec_name()})", lambda: jsonl_io_read(dataset_path), repeat)
+        if examples != fast_examples:
+            raise AssertionError("jsonl_io read different examples than json")
+        write_seconds, _ = benchmark("stdlib write", lambda: stdlib_write(os.path.join(stdlib_dir, "write.jsonl"), examples), repeat)
+        fast_write_seconds, _ = benchmark("jsonl_io write", lambda: jsonl_io_write(os.path.join(jsonl_io_dir, "write.jsonl"), examples), repeat)
+
+        seconds, (num_examples, merged_path) = benchmark(
+            "stdlib end to end", lambda: end_to_end(stdlib_read, stdlib_write, dataset_path, stdlib_dir), repeat)
+        fast_seconds, (_, fast_merged_path) = benchmark(
+            "jsonl_io end to end", lambda: end_to_end(jsonl_io_read, jsonl_io_write, dataset_path, jsonl_io_dir), repeat)
+        identical = all(filecmp.cmp(os.path.join(stdlib_dir, name), os.path.join(jsonl_io_dir, name), shallow=False)
+                        for name in ["write.jsonl", "predictions.jsonl", "merged.jsonl"])
+
+    results.update({
+        "num_examples": num_examples,
+        "identical_output": identical,
+        "read": {"stdlib_seconds": read_seconds, "jsonl_io_seconds": fast_read_seconds, "speedup": read_seconds / fast_read_seconds},
+        "write": {"stdlib_seconds": write_seconds, "jsonl_io_seconds": fast_write_seconds, "speedup": write_seconds / fast_write_seconds},
+        "end_to_end": {"stdlib_seconds": seconds, "jsonl_io_seconds": fast_seconds, "speedup": seconds / fast_seconds,
+                       "jsonl_io_examples_per_sec": num_examples / fast_seconds},
+    })
+    print(f"End to end speedup: {seconds / fast_seconds:.2f}x, output {'identical' if identical else 'DIFFERENT'}", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare JSONL reading and writing through jsonl_io with the stdlib json loop")
+    parser.add_argument("--dataset", choices=list(DATASETS), default="flores")
+    parser.add_argument("--split", choices=["dev", "devtest"], default="devtest")
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many runs")
+
+    args = parser.parse_args()
+
+    bench_jsonl_io(args.dataset, args.split if args.dataset == "flores" else None, args.repeat)
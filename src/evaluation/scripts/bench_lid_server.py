@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+from eval_datasets import dataset_file, iter_jsonl
+from lid_client import RemoteModel
+
+
+def load_test(server, model_name, dataset, split, num_requests, texts_per_request, concurrency, k):
+    """Send num_requests predict requests from concurrency client threads and report latency and throughput."""
+    dataset_path, text_field = dataset_file(dataset, split)
+    texts = [example[text_field].replace("\n", " ") for example in iter_jsonl(dataset_path)]
+    requests = itertools.islice(itertools.cycle(texts[i:i + texts_per_request] for i in range(0, len(texts), texts_per_request)),
+                                num_requests)
+    requests_lock = threading.Lock()
+    latencies = []
+    num_texts = []
+
+    def client():
+        model = RemoteModel(server, model_name)
+        while True:
+            with requests_lock:
+                request = next(requests, None)
+            if request is None:
+                return
+            start_time = time.perf_counter()
+            model.predict(request, k=k)
+            latencies.append(time.perf_counter() - start_time)
+            num_texts.append(len(request))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    latencies_ms = np.array(latencies) * 1000
+    results = {
+        "model": model_name,
+        "concurrency": concurrency,
+        "texts_per_request": texts_per_request,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed,
+        "texts_per_sec": sum(num_texts) / elapsed,
+        "latency_ms": {"p50": float(np.percentile(latencies_ms, 50)), "p99": float(np.percentile(latencies_ms, 99)),
+                       "max": float(latencies_ms.max())},
+    }
+    print(f"{len(latencies)} requests in {elapsed:.2f}s, p50 {results['latency_ms']['p50']:.1f}ms, "
+          f"p99 {results['latency_ms']['p99']:.1f}ms", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test a running lid_server.py")
+    parser.add_argument("--server", default="http://127.0.0.1:8765")
+    parser.add_argument("--model", required=True, help="Served model name, e.g. glotlid or glotlid-restricted")
+    parser.add_argument("--dataset", default="flores")
+    parser.add_argument("--split", default="devtest")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--texts-per-request", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--k", type=int, default=1)
+
+    args = parser.parse_args()
+
+    load_test(args.server, args.model, args.dataset, args.split, args.requests, args.texts_per_request, args.concurrency, args.k)
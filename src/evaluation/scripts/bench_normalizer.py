@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from check_normalizer import DATASET_FILES, preprocess_text_reference
+from eval_datasets import iter_jsonl
+from openlid_normer import clean_line, normalize_batch
+
+
+def benchmark(name, normalize_texts, texts, repeat):
+    num_chars = sum(len(text) for text in texts)
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        normalize_texts(texts)
+        best = min(best, time.perf_counter() - start_time)
+    print(f"{name}: {num_chars / best / 1e6:.2f}M chars/sec", file=sys.stderr)
+    return {"seconds": best, "chars": num_chars, "chars_per_sec": num_chars / best}
+
+
+def bench_normalizer(datasets, repeat):
+    results = {}
+    for dataset in datasets:
+        path, text_field = DATASET_FILES[dataset]
+        if not os.path.exists(path):
+            print(f"{dataset}: {path} not found, skipped", file=sys.stderr)
+            continue
+        texts = [example[text_field] for example in iter_jsonl(path)]
+        results[dataset] = {
+            "clean_line": benchmark(f"{dataset} clean_line", lambda batch: [clean_line(text) for text in batch], texts, repeat),
+            "preprocess_text_reference": benchmark(f"{dataset} preprocess_text_reference",
+                                                   lambda batch: [preprocess_text_reference(text) for text in batch], texts, repeat),
+            "normalize_batch": benchmark(f"{dataset} normalize_batch", normalize_batch, texts, repeat),
+        }
+        results[dataset]["speedup"] = results[dataset]["normalize_batch"]["chars_per_sec"] / results[dataset]["clean_line"]["chars_per_sec"]
+    json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure chars/sec of the OpenLID text normalizer")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASET_FILES), default=list(DATASET_FILES))
+    parser.add_argument("--repeat", type=int, default=5, help="Report the best of this many runs")
+
+    args = parser.parse_args()
+
+    bench_normalizer(args.datasets, args.repeat)
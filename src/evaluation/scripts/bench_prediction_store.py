@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from eval_datasets import DATASETS
+from evaluate import load_data
+from prediction_store import convert_jsonl, store_models
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def benchmark(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    print(f"{name}: {best:.3f}s", file=sys.stderr)
+    return best, result
+
+
+def bench_prediction_store(input_file, dataset, split, repeat):
+    """Compare the size of a merged predictions file and of its prediction store, and the time evaluate.py takes
+    to load the gold and predicted labels of every model from each."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # evaluate.load_data writes the wrong predictions next to its input
+        jsonl_path = os.path.join(tmp_dir, "predictions.jsonl")
+        shutil.copyfile(input_file, jsonl_path)
+        store_path = os.path.join(tmp_dir, "store")
+        convert_jsonl(jsonl_path, dataset, split, store_path)
+
+        results = {"input_file": input_file, "jsonl_bytes": os.path.getsize(jsonl_path), "store_bytes": directory_size(store_path), "models": {}}
+        for model in store_models(store_path):
+            jsonl_seconds, jsonl_labels = benchmark(f"{model} from JSONL", lambda: load_data(jsonl_path, model, dataset), repeat)
+            store_seconds, store_labels = benchmark(f"{model} from store", lambda: load_data(store_path, model, dataset), repeat)
+            if jsonl_labels != store_labels:
+                raise AssertionError(f"The store has different labels for {model} than {input_file}")
+            results["models"][model] = {"jsonl_seconds": jsonl_seconds, "store_seconds": store_seconds, "speedup": jsonl_seconds / store_seconds}
+
+    results["size_ratio"] = results["jsonl_bytes"] / results["store_bytes"]
+    print(f"Store is {results['size_ratio']:.0f}x smaller", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the disk use and load time of a merged predictions file and of a prediction store")
+    parser.add_argument("input_file", help="Merged predictions JSONL file")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True)
+    parser.add_argument("--split", choices=["dev", "devtest"])
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many runs")
+
+    args = parser.parse_args()
+
+    if args.dataset == "flores" and not args.split:
+        parser.error("--split is required for flores dataset")
+
+    bench_prediction_store(args.input_file, args.dataset, args.split, args.repeat)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fasttext_numpy import ENGINES, FASTTEXT_FILEFORMAT_MAGIC_INT32, FASTTEXT_VERSION, LABEL_PREFIX, SOFTMAX_LOSS, SUPERVISED_MODEL
+from topk_scores import FASTTEXT_PREFIX
+
+# characters the synthetic words of every script are drawn from
+SCRIPT_RANGES = {
+    "Latn": (0x61, 0x7a), "Cyrl": (0x430, 0x44f), "Arab": (0x627, 0x64a), "Deva": (0x915, 0x939), "Ethi": (0x1200, 0x1250),
+    "Grek": (0x3b1, 0x3c9), "Hani": (0x4e00, 0x4fff), "Thai": (0xe01, 0xe2e), "Beng": (0x995, 0x9b9), "Hebr": (0x5d0, 0x5ea),
+}
+# share of the labels per script, roughly as in GlotLID
+SCRIPT_SHARES = {"Latn": 0.85, "Cyrl": 0.04, "Arab": 0.025, "Deva": 0.02, "Ethi": 0.01, "Grek": 0.01, "Hani": 0.01, "Thai": 0.01,
+                 "Beng": 0.01, "Hebr": 0.015}
+LABEL_COUNTS = [200, 2000]
+ROW_COUNTS = [1000, 10000, 100000]
+
+
+def synthetic_labels(num_labels):
+    scripts = []
+    for script, share in SCRIPT_SHARES.items():
+        scripts += [script] * max(1, round(share * num_labels))
+    scripts = (scripts + ["Latn"] * num_labels)[:num_labels]
+    return [f"l{i:04d}_{script}" for i, script in enumerate(scripts)]
+
+
+class SyntheticCorpus:
+    """Deterministic multilingual texts: every label has its own vocabulary in its script, with some
+    capitalization, digits and punctuation for the normalizer to remove."""
+
+    def __init__(self, num_labels, words_per_label=50, seed=0):
+        self.labels = synthetic_labels(num_labels)
+        rng = np.random.RandomState(seed)
+        self.vocabularies = []
+        for label in self.labels:
+            low, high = SCRIPT_RANGES[label.rsplit("_", 1)[1]]
+            lengths = rng.randint(2, 9, size=words_per_label)
+            self.vocabularies.append(["".join(map(chr, rng.randint(low, high + 1, size=length))) for length in lengths])
+
+    def _label_indices(self, rng, num_rows, error_rate):
+        golds = rng.randint(len(self.labels), size=num_rows)
+        preds = np.where(rng.random_sample(num_rows) < error_rate, rng.randint(len(self.labels), size=num_rows), golds)
+        return golds, preds
+
+    def label_examples(self, num_rows, seed=1, error_rate=0.1):
+        """(golds, preds) of examples(), without generating the texts."""
+        golds, preds = self._label_indices(np.random.RandomState(seed), num_rows, error_rate)
+        labels = np.array(self.labels, dtype=object)
+        return labels[golds].tolist(), labels[preds].tolist()
+
+    def examples(self, num_rows, seed=1, error_rate=0.1):
+        """(texts, golds, preds): preds differ from golds for about error_rate of the rows."""
+        rng = np.random.RandomState(seed)
+        golds, preds = self._label_indices(rng, num_rows, error_rate)
+        texts = []
+        for gold, num_words in zip(golds, rng.randint(5, 30, size=num_rows)):
+            words = [self.vocabularies[gold][i] for i in rng.randint(len(self.vocabularies[gold]), size=num_words)]
+            words[0] = words[0].capitalize()
+            texts.append(" ".join(words) + rng.choice([".", "!", " 2024.", ", 12 (x)."]))
+        return texts, [self.labels[i] for i in golds], [self.labels[i] for i in preds]
+
+
+def write_synthetic_fasttext_model(path, corpus, dim=256, bucket=20000, minn=2, maxn=5, word_ngrams=2, seed=0):
+    """Write a supervised fastText .bin with the corpus vocabulary and labels and random weights."""
+    rng = np.random.RandomState(seed)
+    words = sorted({word.lower() for vocabulary in corpus.vocabularies for word in vocabulary})
+    labels = [LABEL_PREFIX + label.encode("utf-8") for label in corpus.labels]
+    with open(path, "wb") as f:
+        f.write(struct.pack("<ii", FASTTEXT_FILEFORMAT_MAGIC_INT32, FASTTEXT_VERSION))
+        # dim, ws, epoch, minCount, neg, wordNgrams, loss, model, bucket, minn, maxn, lrUpdateRate, t
+        f.write(struct.pack("<12id", dim, 5, 5, 1, 5, word_ngrams, SOFTMAX_LOSS, SUPERVISED_MODEL, bucket, minn, maxn, 100, 1e-4))
+        f.write(struct.pack("<3i", len(words) + len(labels), len(words), len(labels)))
+        f.write(struct.pack("<2q", len(words), -1))
+        for entries, entry_type in ((words, 0), (labels, 1)):
+            for entry in entries:
+                f.write((entry if entry_type else entry.encode("utf-8")) + b"\0" + struct.pack("<qb", 1, entry_type))
+        for matrix in (rng.uniform(-0.1, 0.1, size=(len(words) + bucket, dim)), rng.normal(0, 1, size=(len(labels), dim))):
+            f.write(struct.pack("<?2q", False, *matrix.shape))
+            f.write(matrix.astype(np.float32).tobytes())
+
+
+def bench_preprocess_text(corpus, num_rows, **_):
+    # fasttext_predictions.preprocess_text only calls normalize; importing it would need the whole predictor stack
+    from openlid_normer import normalize
+    texts, _, _ = corpus.examples(num_rows)
+    return lambda: [normalize(text) for text in texts]
+
+
+def bench_customlid(mode):
+    def bench(corpus, num_rows, model_path, engine, batch_size, **_):
+        from glotlid_customlid import CustomLID
+        texts, _, _ = corpus.examples(num_rows)
+        model = CustomLID(model_path, languages=[FASTTEXT_PREFIX + label for label in corpus.labels], mode=mode, engine=engine)
+        return lambda: [model.predict(texts[i:i + batch_size], k=1) for i in range(0, len(texts), batch_size)]
+    return bench
+
+
+def bench_calculate_metrics(corpus, num_rows, **_):
+    from evaluate import calculate_metrics, confusion_matrix
+    golds, preds = corpus.label_examples(num_rows)
+    allowed_languages = set(corpus.labels)
+    return lambda: calculate_metrics(confusion_matrix(golds, preds), allowed_languages)
+
+
+def bench_prepare_template_data(corpus, num_rows, **_):
+    from confusion_matrix import prepare_template_data
+    golds, preds = corpus.label_examples(num_rows)
+    index = {label: i for i, label in enumerate(corpus.labels)}
+    cm = np.zeros((len(corpus.labels), len(corpus.labels)), dtype=int)
+    np.add.at(cm, ([index[gold] for gold in golds], [index[pred] for pred in preds]), 1)
+    return lambda: prepare_template_data({"model": (cm, corpus.labels)})
+
+
+def bench_get_content_hash(corpus, num_rows, **_):
+    from merge_predictions import get_content_hash
+    texts, golds, preds = corpus.examples(num_rows)
+    examples = [{"id": i, "iso_639_3": gold[:5], "iso_15924": gold[6:], "text": text, "predictions": {"model": pred}}
+                for i, (text, gold, pred) in enumerate(zip(texts, golds, preds))]
+    return lambda: [get_content_hash(example) for example in examples]
+
+
+# name -> (setup returning the function to time, whether it depends on the number of labels, of rows)
+BENCHMARKS = {
+    "preprocess_text": (bench_preprocess_text, False, True),
+    "customlid_before": (bench_customlid("before"), True, True),
+    "customlid_after": (bench_customlid("after"), True, True),
+    "customlid_script": (bench_customlid("script"), True, True),
+    "calculate_metrics": (bench_calculate_metrics, True, True),
+    "prepare_template_data": (bench_prepare_template_data, True, False),
+    "get_content_hash": (bench_get_content_hash, False, True),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(out_path, benchmarks, label_counts, row_counts, repeat, engine, batch_size):
+    """Time every benchmark at every scale it depends on (the best of repeat runs) and save the results as JSON."""
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "engine": engine,
+            "batch_size": batch_size,
+            "repeat": repeat,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as model_dir:
+        for num_labels in label_counts:
+            corpus = SyntheticCorpus(num_labels)
+            model_path = os.path.join(model_dir, f"model_{num_labels}.bin")
+            write_synthetic_fasttext_model(model_path, corpus)
+            for name in benchmarks:
+                setup, uses_labels, uses_rows = BENCHMARKS[name]
+                if not uses_labels and num_labels != label_counts[0]:
+                    continue
+                for num_rows in row_counts if uses_rows else [max(row_counts)]:
+                    key = name + (f"[labels={num_labels}]" if uses_labels else "") + (f"[rows={num_rows}]" if uses_rows else "")
+                    try:
+                        function = setup(corpus, num_rows, model_path=model_path, engine=engine, batch_size=batch_size)
+                    except ImportError as e:
+                        print(f"{key}: skipped ({e})", file=sys.stderr)
+                        continue
+                    times = []
+                    for _ in range(repeat):
+                        start_time = time.perf_counter()
+                        function()
+                        times.append(time.perf_counter() - start_time)
+                    results["results"][key] = {
+                        "seconds": min(times),
+                        "median_seconds": statistics.median(times),
+                        "rows_per_sec": num_rows / min(times) if uses_rows else None,
+                    }
+                    print(f"{key}: {min(times):.4f}s", file=sys.stderr)
+
+    with open(out_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {out_path}", file=sys.stderr)
+
+
+def compare_results(baseline_path, candidate_path, threshold):
+    """Print the time ratio of every benchmark in both runs; returns the number of regressions above threshold."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    for field in ["platform", "cpus", "python", "numpy", "engine", "batch_size"]:
+        if baseline["meta"].get(field) != candidate["meta"].get(field):
+            print(f"Warning: {field} differs: {baseline['meta'].get(field)} vs {candidate['meta'].get(field)}", file=sys.stderr)
+    baseline, candidate = baseline["results"], candidate["results"]
+
+    regressions = 0
+    print(f"{'benchmark':60} {'baseline':>10} {'candidate':>10} {'ratio':>7}")
+    for key in [*baseline, *(key for key in candidate if key not in baseline)]:
+        if key not in baseline or key not in candidate:
+            print(f"{key:60} only in {'candidate' if key in candidate else 'baseline'}")
+            continue
+        ratio = candidate[key]["seconds"] / baseline[key]["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{key:60} {baseline[key]['seconds']:10.4f} {candidate[key]['seconds']:10.4f} {ratio:7.2f}{flag}")
+    print(f"{regressions} regression(s) above {threshold:.0%}", file=sys.stderr)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation hot paths on synthetic multilingual data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the timings as JSON")
+    run_parser.add_argument("--out", required=True, help="JSON file to write the results to")
+    run_parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    run_parser.add_argument("--labels", nargs="+", type=int, default=LABEL_COUNTS, help="Numbers of labels to benchmark with")
+    run_parser.add_argument("--rows", nargs="+", type=int, default=ROW_COUNTS,
+                            help="Numbers of rows to benchmark with (e.g. add 1000000 for the full scale)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the fastest one is reported")
+    run_parser.add_argument("--engine", choices=ENGINES, default="fasttext", help="Engine of the CustomLID benchmarks")
+    run_parser.add_argument("--batch-size", type=int, default=1000, help="Texts per CustomLID call")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two runs and flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Flag benchmarks that got slower by more than this fraction")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.repeat < 1:
+            parser.error("--repeat must be positive")
+        run_suite(args.out, args.benchmarks, args.labels, sorted(args.rows), args.repeat, args.engine, args.batch_size)
+    else:
+        sys.exit(1 if compare_results(args.baseline, args.candidate, args.threshold) else 0)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import resource
+import sys
+import time
+
+from eval_datasets import batched
+from fasttext_predictions import iter_predicted_batches, load_dataset, load_model
+
+
+def benchmark_workers(dataset, split, model_name, model_path, languages_file, enable_preprocessing, batch_size, max_workers, repeat):
+    model = load_model(model_name, model_path, languages_file)
+    data, text_field = load_dataset(dataset, split)
+    examples = [{text_field: example[text_field]} for example in data] * repeat
+    print(f"Benchmarking {len(examples)} examples, batch size {batch_size}", file=sys.stderr)
+
+    runs = []
+    for workers in range(1, max_workers + 1):
+        start_time = time.perf_counter()
+        num_predicted = 0
+        for batch, _ in iter_predicted_batches(batched(examples, batch_size), text_field, workers,
+                                               models=[(model, enable_preprocessing)]):
+            num_predicted += len(batch)
+        elapsed = time.perf_counter() - start_time
+        runs.append({
+            "workers": workers,
+            "seconds": elapsed,
+            "examples_per_sec": num_predicted / elapsed,
+            "speedup": runs[0]["seconds"] / elapsed if runs else 1.0,
+            # ru_maxrss is in kilobytes on Linux; children report the largest worker seen so far
+            "parent_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        })
+        print(f"{workers} worker(s): {runs[-1]['examples_per_sec']:.1f} examples/sec, speedup {runs[-1]['speedup']:.2f}x",
+              file=sys.stderr)
+
+    json.dump(runs, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how fastText prediction scales with --workers")
+    parser.add_argument("--dataset", default="flores")
+    parser.add_argument("--split", default="devtest")
+    parser.add_argument("--model", choices=["glotlid", "openlid", "openlid-v2", "retrained"], required=True)
+    parser.add_argument("--model-path", type=str)
+    parser.add_argument("--languages-file", type=str)
+    parser.add_argument("--enable-preprocessing", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the dataset to get a longer run")
+
+    args = parser.parse_args()
+
+    benchmark_workers(args.dataset, args.split, args.model, args.model_path, args.languages_file,
+                      args.enable_preprocessing, args.batch_size, args.max_workers, args.repeat)
@@ -0,0 +1,107 @@
+import multiprocessing
+
+import numpy as np
+
+# resamples drawn per task; tasks are seeded in order, so the samples do not depend on the number of workers
+RESAMPLES_PER_TASK = 200
+METRICS = ["f1", "fpr"]
+
+
+class _GroupSum:
+    """Sums the columns of a (resamples, cells) count matrix into groups; cells in group -1 are left out."""
+
+    def __init__(self, groups, num_groups):
+        cells = np.flatnonzero(groups >= 0)
+        cells = cells[np.argsort(groups[cells], kind="stable")]
+        sorted_groups = groups[cells]
+        self.cells = cells
+        self.starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]) if len(cells) else cells
+        self.targets = sorted_groups[self.starts]
+        self.num_groups = num_groups
+
+    def __call__(self, counts):
+        sums = np.zeros((counts.shape[0], self.num_groups), dtype=counts.dtype)
+        if len(self.cells):
+            sums[:, self.targets] = np.add.reduceat(counts[:, self.cells], self.starts, axis=1)
+        return sums
+
+
+class _ModelCells:
+    """What the macro metrics of a model need from the cells: the evaluated (supported) gold languages, their
+    true positives and the supported decisions predicting them, as in evaluate.calculate_metrics."""
+
+    def __init__(self, cell_golds, cell_preds, gold_positions, num_rows):
+        self.true_positives = _GroupSum(np.where(cell_golds == cell_preds, gold_positions[cell_golds], -1), num_rows)
+        # false positives are only counted on supported gold languages
+        self.predicted = _GroupSum(np.where(gold_positions[cell_golds] >= 0, gold_positions[cell_preds], -1), num_rows)
+
+
+def _macro_metrics(counts, row_totals, model):
+    """Macro F1 and FPR of every resample (rows of counts), over the gold languages present in it."""
+    tp = model.true_positives(counts)
+    fn = row_totals - tp
+    fp = model.predicted(counts) - tp
+    real_negatives = row_totals.sum(axis=1, keepdims=True) - tp - fn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fpr = np.where(real_negatives > 0, fp / real_negatives, 0)
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0)
+    present = row_totals > 0
+    num_present = present.sum(axis=1)
+    return {"f1": (f1 * present).sum(axis=1) / num_present, "fpr": (fpr * present).sum(axis=1) / num_present}
+
+
+def _resample_task(cell_counts, row_totals_sum, models, num_resamples, seed):
+    rng = np.random.default_rng(seed)
+    num_examples = int(cell_counts.sum())
+    counts = rng.multinomial(num_examples, cell_counts / num_examples, size=num_resamples)
+    row_totals = row_totals_sum(counts)
+    return [_macro_metrics(counts, row_totals, model) for model in models]
+
+
+def bootstrap_macro_metrics(labels, gold_codes, model_codes, allowed_languages, num_resamples, seed=0, workers=1):
+    """Macro F1 and FPR of every model on num_resamples bootstrap resamples of the examples.
+
+    gold_codes and model_codes ({model: codes}) index labels, as returned by evaluate.load_codes. All models are
+    evaluated on the same resamples, so their samples are paired. Rather than drawing row indices, the counts of
+    every distinct (gold, predictions) combination are drawn from a multinomial, which is the same distribution.
+    Returns {model: {metric: array of num_resamples values}}.
+    """
+    cells, cell_counts = np.unique(np.stack([gold_codes, *model_codes.values()], axis=1), axis=0, return_counts=True)
+    allowed = np.array([label in allowed_languages for label in labels], dtype=bool)
+    gold_rows = np.unique(gold_codes)
+    gold_rows = gold_rows[allowed[gold_rows]]
+    gold_positions = np.full(len(labels), -1)
+    gold_positions[gold_rows] = np.arange(len(gold_rows))
+
+    row_totals_sum = _GroupSum(gold_positions[cells[:, 0]], len(gold_rows))
+    models = [_ModelCells(cells[:, 0], cells[:, i + 1], gold_positions, len(gold_rows)) for i in range(len(model_codes))]
+    task_sizes = [min(RESAMPLES_PER_TASK, num_resamples - start) for start in range(0, num_resamples, RESAMPLES_PER_TASK)]
+    tasks = [(cell_counts, row_totals_sum, models, size, task_seed)
+             for size, task_seed in zip(task_sizes, np.random.SeedSequence(seed).spawn(len(task_sizes)))]
+
+    if workers > 1:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            results = pool.starmap(_resample_task, tasks)
+    else:
+        results = [_resample_task(*task) for task in tasks]
+    return {model: {metric: np.concatenate([result[i][metric] for result in results]) for metric in METRICS}
+            for i, model in enumerate(model_codes)}
+
+
+def confidence_interval(samples, confidence=0.95):
+    low, high = np.percentile(samples, [50 * (1 - confidence), 50 * (1 + confidence)])
+    return {"low": float(low), "high": float(high)}
+
+
+def paired_test(samples, other_samples, difference, confidence=0.95):
+    """Paired bootstrap test of a difference of a metric between two models evaluated on the same resamples.
+
+    Returns the observed difference, its confidence interval and a two-sided p-value: the share of resampled
+    differences, centered on their mean, at least as far from 0 as the observed one.
+    """
+    differences = samples - other_samples
+    extreme = np.abs(differences - differences.mean()) >= abs(difference)
+    return {"difference": difference, **confidence_interval(differences, confidence),
+            "p_value": float((extreme.sum() + 1) / (len(differences) + 1))}
@@ -0,0 +1,76 @@
+import multiprocessing
+import sys
+import time
+from collections import defaultdict
+
+from fasttext_numpy import load_fasttext_model
+
+
+class CascadeModel:
+    """Predicts with a general model, then re-predicts the texts whose top label is in a specialist's language group.
+
+    specialists is a list of (name, model_path, labels). A specialist is loaded the first time a text is routed
+    to it, unless load_specialists() is called first (before forking workers, so that they share the loaded
+    models), and only sees the texts routed to it, in one call per batch.
+    Its top-k replaces the general model's, so thresholds, the GlotLID ensemble and saved scores apply to the
+    combined prediction. Texts and time per stage are counted in shared memory for report().
+    """
+
+    def __init__(self, model, specialists, engine="fasttext"):
+        self.model = model
+        self.restricted = getattr(model, "restricted", False)
+        self.engine = engine
+        self.specialist_paths = {}
+        self.label_to_specialist = {}
+        for name, model_path, labels in specialists:
+            self.specialist_paths[name] = model_path
+            for label in labels:
+                if label in self.label_to_specialist:
+                    raise ValueError(f"{label} is in the language groups of both {self.label_to_specialist[label]} and {name}")
+                self.label_to_specialist[label] = name
+        self._specialists = {}
+        self.stage_texts = {stage: multiprocessing.Value("q", 0) for stage in ["general", *self.specialist_paths]}
+        self.stage_seconds = {stage: multiprocessing.Value("d", 0) for stage in ["general", *self.specialist_paths]}
+
+    def specialist(self, name):
+        if name not in self._specialists:
+            print(f"Loading specialist {name} from {self.specialist_paths[name]}...", file=sys.stderr)
+            self._specialists[name] = load_fasttext_model(self.specialist_paths[name], self.engine)
+        return self._specialists[name]
+
+    def load_specialists(self):
+        for name in self.specialist_paths:
+            self.specialist(name)
+
+    def _count(self, stage, num_texts, start_time):
+        with self.stage_texts[stage].get_lock():
+            self.stage_texts[stage].value += num_texts
+        with self.stage_seconds[stage].get_lock():
+            self.stage_seconds[stage].value += time.perf_counter() - start_time
+
+    def predict(self, texts, k=1):
+        start_time = time.perf_counter()
+        labels, probs = self.model.predict(texts, k=k)
+        labels, probs = list(labels), list(probs)
+        self._count("general", len(texts), start_time)
+
+        routed = defaultdict(list)
+        for i, text_labels in enumerate(labels):
+            if len(text_labels) and text_labels[0] in self.label_to_specialist:
+                routed[self.label_to_specialist[text_labels[0]]].append(i)
+        for name, indices in routed.items():
+            specialist = self.specialist(name)
+            start_time = time.perf_counter()
+            specialist_labels, specialist_probs = specialist.predict([texts[i] for i in indices], k=k)
+            for i, text_labels, text_probs in zip(indices, specialist_labels, specialist_probs):
+                labels[i], probs[i] = text_labels, text_probs
+            self._count(name, len(indices), start_time)
+        return labels, probs
+
+    def report(self):
+        num_texts = self.stage_texts["general"].value
+        print(f"Cascade: general model predicted {num_texts} texts in {self.stage_seconds['general'].value:.2f}s", file=sys.stderr)
+        for name in self.specialist_paths:
+            routed = self.stage_texts[name].value
+            print(f"  {name}: {routed} texts ({routed / num_texts if num_texts else 0:.1%}) in {self.stage_seconds[name].value:.2f}s",
+                  file=sys.stderr)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+import fasttext
+import numpy as np
+from check_normalizer import DATASET_FILES
+from eval_datasets import batched, iter_jsonl
+from fasttext_numpy import FastTextNumpy
+from openlid_normer import normalize_batch
+
+
+def tie_only_difference(reference_labels, reference_probs, labels, probs, k, tolerance):
+    """Whether two top-k predictions only differ in the order of labels with equal probabilities, or in which of
+    the labels tied at the k-th probability are kept. fastText orders tied labels by its heap, fasttext_numpy by
+    label index; ova and ns models often give several labels probability 1."""
+    if len(reference_labels) != len(labels) or np.abs(np.asarray(reference_probs) - np.asarray(probs)).max(initial=0) > tolerance:
+        return False
+    start = 0
+    for end in range(1, len(labels) + 1):
+        if end < len(labels) and reference_probs[end - 1] - reference_probs[end] <= tolerance:
+            continue
+        # a group reaching the k-th label may be cut, so other labels of the same probability may be kept
+        cut = end == len(labels) == k
+        if not cut and set(reference_labels[start:end]) != set(labels[start:end]):
+            return False
+        start = end
+    return True
+
+
+def check_texts(name, texts, reference, model, k, batch_size, tolerance, max_reported=5):
+    vector_mismatches = label_mismatches = tie_mismatches = tie_top1_mismatches = 0
+    max_vector_diff = max_prob_diff = 0.0
+    for batch in batched(texts, batch_size):
+        reference_vectors = np.stack([reference.get_sentence_vector(text) for text in batch])
+        vectors = model.get_sentence_vectors(batch)
+        vector_diff = np.abs(reference_vectors - vectors).max(axis=1)
+        vector_mismatches += int(np.count_nonzero(vector_diff > tolerance))
+        max_vector_diff = max(max_vector_diff, float(vector_diff.max()))
+
+        reference_labels, reference_probs = reference.predict(batch, k=k)
+        labels, probs = model.predict(batch, k=k)
+        for text, text_reference_labels, text_reference_probs, text_labels, text_probs in zip(
+                batch, reference_labels, reference_probs, labels, probs):
+            if list(text_reference_labels) == list(text_labels):
+                continue
+            if tie_only_difference(text_reference_labels, text_reference_probs, text_labels, text_probs, k, tolerance):
+                tie_mismatches += 1
+                tie_top1_mismatches += text_reference_labels[0] != text_labels[0]
+            else:
+                label_mismatches += 1
+                if label_mismatches <= max_reported:
+                    print(f"  {text!r}: fasttext predicts {text_reference_labels}, fasttext_numpy {text_labels}")
+        max_prob_diff = max([max_prob_diff] + [float(np.abs(np.sort(a) - np.sort(b)).max(initial=0))
+                                                for a, b in zip(reference_probs, probs) if len(a) == len(b)])
+
+    print(f"{name}: {len(texts)} texts, {label_mismatches} label mismatches, {vector_mismatches} sentence vector mismatches, "
+          f"max sentence vector difference {max_vector_diff:.3g}, max probability difference {max_prob_diff:.3g}")
+    if tie_mismatches:
+        # not failures: both orders are valid rankings of the same probabilities
+        print(f"  {tie_mismatches} texts only order labels of equal probability differently "
+              f"({tie_top1_mismatches} with a different top-1 label among them)")
+    return label_mismatches + vector_mismatches + (max_prob_diff > tolerance)
+
+
+def check_fasttext_numpy(model_path, datasets, enable_preprocessing, k, batch_size, tolerance):
+    reference = fasttext.load_model(model_path)
+    model = FastTextNumpy(model_path)
+    mismatches = 0
+    for name in datasets:
+        path, text_field = DATASET_FILES[name]
+        if not os.path.exists(path):
+            print(f"{name}: {path} not found, skipped")
+            continue
+        texts = [example[text_field] for example in iter_jsonl(path)]
+        if enable_preprocessing:
+            texts = normalize_batch(texts)
+        # the fasttext binding rejects multi-line texts, which only happens without preprocessing
+        texts = [text for text in texts if "\n" not in text]
+        mismatches += check_texts(name, texts, reference, model, k, batch_size, tolerance)
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that fasttext_numpy gives the same sentence vectors and predictions as the fasttext binding")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASET_FILES), default=list(DATASET_FILES))
+    parser.add_argument("--enable-preprocessing", action="store_true")
+    parser.add_argument("--k", type=int, default=5, help="Number of predicted labels to compare")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--tolerance", type=float, default=1e-5,
+                       help="Largest accepted absolute difference of sentence vector components and probabilities")
+
+    args = parser.parse_args()
+
+    sys.exit(1 if check_fasttext_numpy(args.model_path, args.datasets, args.enable_preprocessing, args.k, args.batch_size, args.tolerance) else 0)
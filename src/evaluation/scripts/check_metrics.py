@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from evaluate import compute_results, load_data, load_languages_file
+
+
+def confusion_matrix_reference(golds, preds):
+    """confusion_matrix as it was in evaluate.py before it encoded the labels as integers"""
+    cm = defaultdict(Counter)
+    for gold, pred in zip(golds, preds):
+        cm[gold][pred] += 1
+    return cm
+
+
+def calculate_metrics_reference(confusion_matrix, allowed_languages):
+    """calculate_metrics as it was in evaluate.py before it used arrays"""
+    per_langauge = {}
+
+    valid_decisions = 0  # all decisions done on supported target languages
+    for gold in confusion_matrix:
+        if gold not in allowed_languages:
+            continue
+
+        for pred in confusion_matrix[gold]:
+            valid_decisions += confusion_matrix[gold][pred]
+
+    for gold in confusion_matrix:
+        if gold not in allowed_languages:
+            continue
+
+        tp = confusion_matrix[gold][gold]
+        fn = sum(confusion_matrix[gold][lang] for lang in confusion_matrix[gold] if lang != gold)  # punish all false negatives when gold is supported
+        fp = sum(confusion_matrix[lang][gold] for lang in confusion_matrix if lang != gold and lang in allowed_languages)  # do not punish false positives when the target language is not supported
+
+        real_negatives = valid_decisions - tp - fn
+        fpr = fp / real_negatives if real_negatives > 0 else 0
+
+        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+
+        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+
+        per_langauge[gold] = {"f1": f1, "tp": tp, "fn": fn, "fp": fp, "fpr": fpr, "precision": precision, "recall": recall}
+
+    return per_langauge
+
+
+def compute_results_reference(golds, preds, allowed_languages):
+    cm = confusion_matrix_reference(golds, preds)
+    per_lang_metrics = calculate_metrics_reference(cm, allowed_languages)
+    n = len(per_lang_metrics)
+    return {
+        "macro_averages": {
+            "f1": sum(per_lang_metrics[lang]["f1"] for lang in per_lang_metrics) / n,
+            "fpr": sum(per_lang_metrics[lang]["fpr"] for lang in per_lang_metrics) / n,
+            "precision": sum(per_lang_metrics[lang]["precision"] for lang in per_lang_metrics) / n,
+            "recall": sum(per_lang_metrics[lang]["recall"] for lang in per_lang_metrics) / n,
+            "num_examples": sum(per_lang_metrics[lang]["tp"] + per_lang_metrics[lang]["fn"] for lang in per_lang_metrics)
+        },
+        "per_language": per_lang_metrics,
+        "confusion_matrix": cm
+    }
+
+
+def synthetic_cases(num_rows, num_labels, seed=0):
+    """(name, golds, preds, allowed languages): random labels with unsupported golds and predictions, labels
+    that are never predicted or only predicted, and degenerate matrices"""
+    rng = np.random.RandomState(seed)
+    labels = [f"l{i:04d}_Latn" for i in range(num_labels)]
+    allowed = set(labels[:num_labels * 3 // 4])
+    extra = [f"x{i:02d}_Zxxx" for i in range(5)]
+    golds = [labels[i] for i in rng.zipf(1.3, size=num_rows) % num_labels]
+    for error_rate in [0.0, 0.1, 0.5, 1.0]:
+        wrong = rng.random_sample(num_rows) < error_rate
+        choices = rng.randint(num_labels + len(extra), size=num_rows)
+        preds = [(labels + extra)[choice] if is_wrong else gold for gold, is_wrong, choice in zip(golds, wrong, choices)]
+        yield f"{num_rows} rows, {num_labels} labels, {error_rate:.0%} errors", golds, preds, allowed
+    yield "single row", golds[:1], golds[:1], allowed
+    yield "only unsupported predictions", golds, [extra[0]] * num_rows, allowed
+    yield "one supported language", golds, preds, {golds[0]}
+
+
+def check_case(name, golds, preds, allowed_languages):
+    start_time = time.perf_counter()
+    reference = json.dumps(compute_results_reference(golds, preds, allowed_languages), indent=2)
+    reference_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    results = json.dumps(compute_results(golds, preds, allowed_languages), indent=2)
+    seconds = time.perf_counter() - start_time
+    identical = results == reference
+    print(f"{name}: {'identical' if identical else 'DIFFERENT'} JSON, "
+          f"{reference_seconds:.3f}s with the reference, {seconds:.3f}s ({reference_seconds / seconds:.1f}x)")
+    return identical
+
+
+def check_metrics(num_rows, num_labels, predictions):
+    mismatches = 0
+    for case in synthetic_cases(num_rows, num_labels):
+        mismatches += not check_case(*case)
+    for input_file, model, dataset, languages_file in predictions:
+        golds, preds = load_data(input_file, model, dataset)
+        mismatches += not check_case(f"{input_file} ({model})", golds, preds, load_languages_file(languages_file))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that evaluate.compute_results gives the same JSON as the dict-based reference")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows of the synthetic cases")
+    parser.add_argument("--labels", type=int, default=2000, help="Labels of the synthetic cases")
+    parser.add_argument("--predictions", nargs=4, action="append", default=[],
+                        metavar=("INPUT_FILE", "MODEL", "DATASET", "LANGUAGES_FILE"),
+                        help="Also check the evaluation of a predictions file (as evaluate.py takes it)")
+
+    args = parser.parse_args()
+
+    sys.exit(1 if check_metrics(args.rows, args.labels, args.predictions) else 0)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+import regex
+from eval_datasets import dataset_file, iter_jsonl
+from openlid_normer import NONWORD_REPLACE_PAT, SPACE_PAT, clean_line, normalize_batch
+
+DATASET_FILES = {
+    "flores_plus_dev": dataset_file("flores", "dev"),
+    "flores_plus_devtest": dataset_file("flores", "devtest"),
+    "udhr": dataset_file("udhr"),
+    "fastspell": dataset_file("fastspell"),
+}
+
+
+def preprocess_text_reference(text):
+    """preprocess_text as it was in fasttext_predictions.py before it used openlid_normer.normalize"""
+    text = text.replace('\n', ' ').strip().lower()
+    text = regex.sub(NONWORD_REPLACE_PAT, "", text)
+    text = regex.sub(SPACE_PAT, " ", text)
+    return text
+
+
+def check_texts(name, texts, max_reported=5):
+    mismatches = 0
+    for text, normalized in zip(texts, normalize_batch(texts)):
+        for reference in (clean_line, preprocess_text_reference):
+            if reference(text) != normalized:
+                mismatches += 1
+                if mismatches <= max_reported:
+                    print(f"  {reference.__name__}({text!r}) = {reference(text)!r}, normalize gives {normalized!r}")
+                break
+    print(f"{name}: {len(texts)} texts, {mismatches} mismatches")
+    return mismatches
+
+
+def codepoint_texts():
+    # every code point on its own, between letters, between spaces and doubled
+    for codepoint in range(sys.maxunicode + 1):
+        char = chr(codepoint)
+        yield from (char, f"a{char}b", f"a {char} b", char + char, f" {char}\n{char} ")
+
+
+def check_normalizer(datasets, exhaustive):
+    mismatches = 0
+    for name in datasets:
+        path, text_field = DATASET_FILES[name]
+        if not os.path.exists(path):
+            print(f"{name}: {path} not found, skipped")
+            continue
+        mismatches += check_texts(name, [example[text_field] for example in iter_jsonl(path)])
+
+    if exhaustive:
+        mismatches += check_texts("all code points", list(codepoint_texts()))
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that openlid_normer.normalize matches the regex reference implementations")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASET_FILES), default=list(DATASET_FILES))
+    parser.add_argument("--exhaustive", action="store_true", help="Also check every Unicode code point in several contexts")
+
+    args = parser.parse_args()
+
+    sys.exit(1 if check_normalizer(args.datasets, args.exhaustive) else 0)
@@ -6,13 +6,28 @@ import os
 import numpy as np
 from jinja2 import Environment, FileSystemLoader
 
+from prediction_store import GOLD, load_column, store_models
+
 
 def load_confusion_matrix_from_evaluation(eval_file, languages_file=None):
     with open(eval_file, "r") as f:
         data = json.load(f)
 
-    confusion_dict = data["confusion_matrix"]
+    return confusion_matrix_from_dict(data["confusion_matrix"], languages_file)
+
+
+def load_confusion_matrix_from_store(store_path, model, languages_file=None):
+    """Count the confusion matrix of a model from the gold and prediction columns of a prediction store."""
+    gold_labels, gold_indices = load_column(store_path, GOLD)
+    pred_labels, pred_indices = load_column(store_path, model)
+    counts = np.bincount(gold_indices.astype(np.int64) * len(pred_labels) + pred_indices,
+                         minlength=len(gold_labels) * len(pred_labels)).reshape(len(gold_labels), len(pred_labels))
+    confusion_dict = {gold_lang: {pred_labels[j]: int(counts[i, j]) for j in np.flatnonzero(counts[i])}
+                      for i, gold_lang in enumerate(gold_labels)}
+    return confusion_matrix_from_dict(confusion_dict, languages_file)
 
+
+def confusion_matrix_from_dict(confusion_dict, languages_file=None):
     allowed_languages = None
     if languages_file:
         with open(languages_file, "r") as f:
@@ -130,13 +145,20 @@ def create_html_confusion_matrix(models_data, output_file):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("evaluation_files", nargs="+", help="One or more evaluation JSON files")
+    parser.add_argument("evaluation_files", nargs="*", help="One or more evaluation JSON files")
+    parser.add_argument("--store", help="Count the confusion matrices from a prediction store directory instead (see prediction_store.py)")
+    parser.add_argument("--models", nargs="+", help="Models of --store to show (default: all)")
     parser.add_argument("--languages-file")
     parser.add_argument("--output", default="confusion_matrix.html")
 
     args = parser.parse_args()
 
+    if bool(args.evaluation_files) == bool(args.store):
+        parser.error("Pass either evaluation files or --store")
+
     models_data = {}
+    for model_name in (args.models or store_models(args.store)) if args.store else []:
+        models_data[model_name] = load_confusion_matrix_from_store(args.store, model_name, args.languages_file)
     for eval_file in args.evaluation_files:
         model_name = eval_file.split("/")[-1].replace("_evaluation.json", "")
         cm, languages = load_confusion_matrix_from_evaluation(eval_file, args.languages_file)
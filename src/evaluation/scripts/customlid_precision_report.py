@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from eval_datasets import batched, dataset_file, iter_jsonl
+from evaluate import compute_results, extract_language
+from fasttext_predictions import FASTTEXT_PREFIX, load_language_list
+from glotlid_customlid import CustomLID
+from openlid_normer import normalize_batch
+
+MATRIX_DTYPES = ["float32", "float16", "int8"]
+REPORT_DATASETS = [("flores", "devtest"), ("udhr", None)]
+
+
+def predict_top_1(model, texts, batch_size):
+    labels, probs = [], []
+    for batch in batched(texts, batch_size):
+        batch_labels, batch_probs = model.predict(batch, k=1)
+        labels.extend(text_labels[0].removeprefix(FASTTEXT_PREFIX) for text_labels in batch_labels)
+        probs.extend(text_probs[0] for text_probs in batch_probs)
+    return labels, np.array(probs)
+
+
+def precision_report(model_path, languages_file, prediction_mode, enable_preprocessing, batch_size):
+    """Accuracy of the reduced-precision CustomLID output matrices relative to float32."""
+    languages = load_language_list(languages_file)
+    allowed_languages = {language.removeprefix(FASTTEXT_PREFIX) for language in languages}
+    models = {dtype: CustomLID(model_path, languages=languages, mode=prediction_mode, matrix_dtype=dtype) for dtype in MATRIX_DTYPES}
+
+    report = {"matrix_bytes": {dtype: model.output_matrix.nbytes for dtype, model in models.items()}, "datasets": {}}
+    for dataset, split in REPORT_DATASETS:
+        dataset_path, text_field = dataset_file(dataset, split)
+        examples = list(iter_jsonl(dataset_path))
+        texts = [example[text_field] for example in examples]
+        if enable_preprocessing:
+            texts = normalize_batch(texts)
+        golds = [extract_language(example, dataset) for example in examples]
+
+        print(f"Predicting {len(texts)} {dataset} examples...", file=sys.stderr)
+        predictions = {dtype: predict_top_1(model, texts, batch_size) for dtype, model in models.items()}
+        reference_labels, reference_probs = predictions["float32"]
+        reference_f1 = compute_results(golds, reference_labels, allowed_languages)["macro_averages"]["f1"]
+
+        dataset_report = {}
+        for dtype, (labels, probs) in predictions.items():
+            macro_f1 = compute_results(golds, labels, allowed_languages)["macro_averages"]["f1"]
+            prob_delta = np.abs(probs - reference_probs)
+            dataset_report[dtype] = {
+                "macro_f1": macro_f1,
+                "macro_f1_delta": macro_f1 - reference_f1,
+                "label_agreement": sum(a == b for a, b in zip(labels, reference_labels)) / len(labels),
+                "max_top_prob_delta": float(prob_delta.max()),
+                "mean_top_prob_delta": float(prob_delta.mean()),
+            }
+        report["datasets"][dataset] = dataset_report
+
+    json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare float16 and int8 CustomLID output matrices with float32 on FLORES+ devtest and UDHR")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--languages-file", required=True)
+    parser.add_argument("--prediction-mode", choices=["before", "after"], default="before")
+    parser.add_argument("--enable-preprocessing", action="store_true",
+                       help="Normalize the texts first, as for the OpenLID models")
+    parser.add_argument("--batch-size", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    precision_report(args.model_path, args.languages_file, args.prediction_mode, args.enable_preprocessing, args.batch_size)
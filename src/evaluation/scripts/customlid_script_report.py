@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from customlid_precision_report import REPORT_DATASETS, predict_top_1
+from eval_datasets import dataset_file, iter_jsonl
+from evaluate import compute_results, extract_language
+from fasttext_numpy import ENGINES
+from fasttext_predictions import FASTTEXT_PREFIX, load_language_list
+from glotlid_customlid import CustomLID
+from openlid_normer import normalize_batch
+
+
+def script_report(model_path, languages_file, matrix_dtype, engine, enable_preprocessing, batch_size):
+    """Accuracy and throughput of script-gated CustomLID relative to limiting before the softmax."""
+    languages = load_language_list(languages_file)
+    allowed_languages = {language.removeprefix(FASTTEXT_PREFIX) for language in languages}
+    models = {mode: CustomLID(model_path, languages=languages, mode=mode, matrix_dtype=matrix_dtype, engine=engine)
+              for mode in ["before", "script"]}
+    gated = models["script"]
+
+    report = {
+        "num_labels": len(gated.labels),
+        "ungated_labels": len(gated.ungated_label_indices),
+        "labels_per_script": {script: len(indices) for script, indices in zip(gated.script_profiler.scripts, gated.script_label_indices)},
+        "datasets": {},
+    }
+    for dataset, split in REPORT_DATASETS:
+        dataset_path, text_field = dataset_file(dataset, split)
+        examples = list(iter_jsonl(dataset_path))
+        texts = [example[text_field] for example in examples]
+        if enable_preprocessing:
+            texts = normalize_batch(texts)
+        golds = [extract_language(example, dataset) for example in examples]
+
+        print(f"Predicting {len(texts)} {dataset} examples...", file=sys.stderr)
+        dataset_report = {}
+        predictions = {}
+        for mode, model in models.items():
+            start_time = time.perf_counter()
+            predictions[mode] = predict_top_1(model, texts, batch_size)
+            elapsed = time.perf_counter() - start_time
+            dataset_report[mode] = {
+                "macro_f1": compute_results(golds, predictions[mode][0], allowed_languages)["macro_averages"]["f1"],
+                "seconds": elapsed,
+                "texts_per_sec": len(texts) / elapsed,
+            }
+        # average share of the restricted labels a text is scored against
+        signatures = gated.script_profiler.profile(texts) > 0
+        scored_labels = [len(gated._script_output_matrix(signature)[0]) for signature in signatures]
+        dataset_report["script"]["mean_scored_labels"] = float(np.mean(scored_labels))
+        dataset_report["script"]["macro_f1_delta"] = dataset_report["script"]["macro_f1"] - dataset_report["before"]["macro_f1"]
+        dataset_report["script"]["label_agreement"] = sum(a == b for a, b in zip(predictions["script"][0], predictions["before"][0])) / len(texts)
+        report["datasets"][dataset] = dataset_report
+        print(f"  {dataset}: macro F1 {dataset_report['before']['macro_f1']:.4f} -> {dataset_report['script']['macro_f1']:.4f}, "
+              f"{dataset_report['before']['texts_per_sec']:.0f} -> {dataset_report['script']['texts_per_sec']:.0f} texts/sec",
+              file=sys.stderr)
+
+    json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare script-gated CustomLID with limiting before the softmax on FLORES+ devtest and UDHR")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--languages-file", required=True)
+    parser.add_argument("--matrix-dtype", choices=["float32", "float16", "int8"], default="float32")
+    parser.add_argument("--engine", choices=ENGINES, default="fasttext")
+    parser.add_argument("--enable-preprocessing", action="store_true",
+                       help="Normalize the texts first, as for the OpenLID models")
+    parser.add_argument("--batch-size", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    script_report(args.model_path, args.languages_file, args.matrix_dtype, args.engine, args.enable_preprocessing, args.batch_size)
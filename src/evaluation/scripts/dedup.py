@@ -0,0 +1,63 @@
+import hashlib
+import multiprocessing
+import sys
+from collections import OrderedDict
+
+# distinct texts whose predictions are kept; older ones are predicted again if they come back
+DEFAULT_DEDUP_MAX_ENTRIES = 1_000_000
+
+
+def text_key(text):
+    # a digest rather than the text itself, so long documents are not kept in memory
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class DedupModel:
+    """Predicts every distinct input text once, with the same predict(texts, k) interface.
+
+    The predictions of the max_entries most recently seen texts are kept, so duplicates in later batches are
+    not predicted again (with forked workers, each worker keeps its own). The model is called once per batch
+    with the new distinct texts, and the results are returned for every input text, in order. Input texts and
+    texts predicted are counted in shared memory for report().
+    """
+
+    def __init__(self, model, name="model", max_entries=DEFAULT_DEDUP_MAX_ENTRIES):
+        self.model = model
+        self.restricted = getattr(model, "restricted", False)
+        self.name = name
+        self.max_entries = max_entries
+        # (k, text key) -> (labels, probs), least recently used first
+        self.predictions = OrderedDict()
+        self.num_texts = multiprocessing.Value("q", 0)
+        self.num_predicted = multiprocessing.Value("q", 0)
+
+    def predict(self, texts, k=1):
+        predictions = self.predictions
+        keys = [(k, text_key(text)) for text in texts]
+        # the predictions of this batch, which eviction must not drop before they are returned
+        batch, new = {}, {}
+        for key, text in zip(keys, texts):
+            if key in batch or key in new:
+                continue
+            if key in predictions:
+                predictions.move_to_end(key)
+                batch[key] = predictions[key]
+            else:
+                new[key] = text
+        if new:
+            labels, probs = self.model.predict(list(new.values()), k=k)
+            for key, prediction in zip(new, zip(labels, probs)):
+                batch[key] = predictions[key] = prediction
+            while len(predictions) > self.max_entries:
+                predictions.popitem(last=False)
+
+        with self.num_texts.get_lock():
+            self.num_texts.value += len(texts)
+        with self.num_predicted.get_lock():
+            self.num_predicted.value += len(new)
+        return [batch[key][0] for key in keys], [batch[key][1] for key in keys]
+
+    def report(self):
+        num_texts, num_predicted = self.num_texts.value, self.num_predicted.value
+        print(f"Dedup ({self.name}): predicted {num_predicted} distinct texts for {num_texts} rows "
+              f"({1 - num_predicted / num_texts if num_texts else 0:.1%} duplicates skipped)", file=sys.stderr)
@@ -0,0 +1,154 @@
+import multiprocessing
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+# documents that needed more windows are counted in the last bucket of the report
+MAX_REPORTED_WINDOWS = 64
+
+
+def split_windows(text, window_chars):
+    """Split a text at whitespace into windows of at most window_chars characters (longer tokens are cut)."""
+    windows, current, length = [], [], 0
+    for token in text.split():
+        while len(token) > window_chars:
+            if current:
+                windows.append(" ".join(current))
+                current, length = [], 0
+            windows.append(token[:window_chars])
+            token = token[window_chars:]
+        if current and length + 1 + len(token) > window_chars:
+            windows.append(" ".join(current))
+            current, length = [], 0
+        length += len(token) + bool(current)
+        current.append(token)
+    if current:
+        windows.append(" ".join(current))
+    return windows
+
+
+def spread_order(n):
+    """0..n-1 ordered so that every prefix is spread over the whole range: 0, n/2, n/4, 3n/4, ..."""
+    order, seen = [], set()
+    step = 1 << max(n - 1, 0).bit_length()
+    while step:
+        for i in range(0, n, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        step //= 2
+    return order
+
+
+class _Document:
+    def __init__(self, windows, max_windows):
+        self.windows = [windows[i] for i in spread_order(len(windows))[:max_windows]]
+        self.weights = [len(window) for window in self.windows]
+        self.remaining_weight = sum(self.weights)
+        self.scores = defaultdict(float)
+        self.num_evaluated = 0
+        self.done = False
+
+    def next_windows(self):
+        # the number of evaluated windows doubles every round, so a document takes O(log n) model calls
+        return self.windows[self.num_evaluated:self.num_evaluated + max(1, self.num_evaluated)]
+
+    def add(self, labels, probs):
+        # every window votes for its top label only, so the document label does not depend on the k requested
+        for window_labels, window_probs in zip(labels, probs):
+            weight = self.weights[self.num_evaluated]
+            if len(window_labels):
+                self.scores[window_labels[0]] += weight * float(window_probs[0])
+            self.remaining_weight -= weight
+            self.num_evaluated += 1
+        top_scores = sorted(self.scores.values(), reverse=True)[:2] + [0.0]
+        # even if every remaining window gave the runner-up probability 1, it could not overtake the leader
+        self.done = self.num_evaluated == len(self.windows) or top_scores[0] - top_scores[1] > self.remaining_weight
+
+    def top_k(self, k, dtype):
+        evaluated_weight = sum(self.weights[:self.num_evaluated])
+        ranked = sorted(self.scores.items(), key=lambda item: -item[1])[:k]
+        return tuple(label for label, _ in ranked), np.array([score / evaluated_weight for _, score in ranked], dtype=dtype)
+
+
+class DocumentModel:
+    """Predicts long texts as windows of at most window_chars characters, with the same predict(texts, k) interface.
+
+    Texts that fit in one window are passed to the model unchanged. The windows of longer texts are predicted
+    in rounds, batched over all documents still undecided, in an order spread over the document; every window
+    adds its top-1 probability, weighted by its length, to the vote of its top label. A document stops as soon
+    as its leading label cannot be overtaken by the windows left, so its top label is the one all windows would
+    give, whatever k is. The returned top k (fewer if fewer labels won a window) are the labels with the most
+    votes, with their votes divided by the weight of the windows evaluated. max_windows
+    caps the windows considered per document (spread over it). Windows evaluated per document are counted in
+    shared memory for report().
+    """
+
+    def __init__(self, model, window_chars=500, max_windows=None):
+        self.model = model
+        self.restricted = getattr(model, "restricted", False)
+        self.window_chars = window_chars
+        self.max_windows = max_windows
+        self.num_documents = multiprocessing.Value("q", 0)
+        self.num_windows = multiprocessing.Value("q", 0)
+        self.num_evaluated = multiprocessing.Value("q", 0)
+        self.evaluated_counts = multiprocessing.Array("q", MAX_REPORTED_WINDOWS + 1)
+
+    def predict(self, texts, k=1):
+        labels, probs = [None] * len(texts), [None] * len(texts)
+        documents = {}
+        short = []
+        for i, text in enumerate(texts):
+            windows = split_windows(text, self.window_chars)
+            if len(windows) > 1:
+                documents[i] = _Document(windows, self.max_windows)
+            else:
+                short.append(i)
+
+        if short:
+            short_labels, short_probs = self.model.predict([texts[i] for i in short], k=k)
+            for i, text_labels, text_probs in zip(short, short_labels, short_probs):
+                labels[i], probs[i] = text_labels, text_probs
+
+        active = list(documents.values())
+        dtype = np.float32
+        while active:
+            requests = [(document, document.next_windows()) for document in active]
+            round_labels, round_probs = self.model.predict([window for _, windows in requests for window in windows], k=1)
+            if len(round_probs):
+                dtype = np.asarray(round_probs[0]).dtype
+            start = 0
+            for document, windows in requests:
+                document.add(round_labels[start:start + len(windows)], round_probs[start:start + len(windows)])
+                start += len(windows)
+            active = [document for document in active if not document.done]
+
+        for i, document in documents.items():
+            labels[i], probs[i] = document.top_k(k, dtype)
+        self._count([1] * len(short) + [document.num_evaluated for document in documents.values()],
+                    len(short) + sum(len(document.windows) for document in documents.values()))
+        return labels, probs
+
+    def _count(self, evaluated, num_windows):
+        with self.num_documents.get_lock():
+            self.num_documents.value += len(evaluated)
+        with self.num_windows.get_lock():
+            self.num_windows.value += num_windows
+        with self.num_evaluated.get_lock():
+            self.num_evaluated.value += sum(evaluated)
+        with self.evaluated_counts.get_lock():
+            for num_evaluated in evaluated:
+                self.evaluated_counts[min(num_evaluated, MAX_REPORTED_WINDOWS)] += 1
+
+    def report(self):
+        num_documents = self.num_documents.value
+        if not num_documents:
+            return
+        counts = np.array(self.evaluated_counts[:])
+        median = int(np.searchsorted(np.cumsum(counts), (num_documents + 1) // 2))
+        print(f"Document mode: {num_documents} documents, {self.num_evaluated.value} of {self.num_windows.value} windows evaluated "
+              f"({self.num_evaluated.value / num_documents:.2f} per document, median {median})", file=sys.stderr)
+        for num_evaluated in np.flatnonzero(counts):
+            more = "+" if num_evaluated == MAX_REPORTED_WINDOWS else ""
+            print(f"  {num_evaluated}{more} windows: {counts[num_evaluated]} documents", file=sys.stderr)
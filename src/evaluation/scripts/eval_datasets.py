@@ -1,28 +1,106 @@
 #!/usr/bin/env python3
 
-import json
+import os
 import sys
+from dataclasses import dataclass
+from itertools import islice
 
+from jsonl_io import iter_jsonl
 
-def load_flores_data(split):
-    print(f"Loading FLORES+ {split} data...", file=sys.stderr)
-    data = []
+# benchmark files are looked up under this directory (relative to the working directory unless absolute)
+DATA_DIR = os.environ.get("OPENLID_EVAL_DATA_DIR", "data")
+# a benchmark may also be stored compressed, as <path>.gz or <path>.zst
+COMPRESSED_SUFFIXES = [".gz", ".zst"]
 
-    with open(f"data/flores_plus/{split}.jsonl", "r", encoding="utf-8") as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
 
-    print(f"Loaded {len(data)} examples", file=sys.stderr)
-    return data
+@dataclass(frozen=True)
+class Dataset:
+    """A benchmark: its JSONL file under DATA_DIR ({split} is replaced by the split), the field holding the text
+    and the fields joined with "_" into the gold label."""
+    path: str
+    text_field: str
+    label_fields: tuple
+    splits: tuple = ()
 
+    def file(self, split=None):
+        if self.splits and split not in self.splits:
+            raise ValueError(f"Split must be one of {', '.join(self.splits)} for {self.path}")
+        path = os.path.join(DATA_DIR, self.path.format(split=split))
+        for candidate in [path, *(path + suffix for suffix in COMPRESSED_SUFFIXES)]:
+            if os.path.exists(candidate):
+                return candidate
+        return path
 
-def load_udhr_data(path="udhr"):
-    print(f"Loading {path} test data...", file=sys.stderr)
-    data = []
+    def label(self, example):
+        return "_".join(example[field] for field in self.label_fields)
+
+
+def _test_set(name):
+    # created by the scripts in new_benchmarks_creation in the UDHR format
+    return Dataset(f"{name}/test.jsonl", "sentence", ("id",))
+
+
+DATASETS = {
+    "flores": Dataset("flores_plus/{split}.jsonl", "text", ("iso_639_3", "iso_15924"), ("dev", "devtest")),
+    **{name: _test_set(name) for name in [
+        "udhr", "fastspell", "setimes", "parlasent", "he_bcs_ge_full", "ITDI_2022", "hplt", "hrv_Latn-was-wrong",
+        "bos_Latn-was-wrong", "srp_Cyrl-was-wrong", "nob_Latn-was-wrong"
+    ]},
+}
+NON_FLORES_DATASETS = set(DATASETS) - {"flores"}
+
+
+def get_dataset(dataset):
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}. Available datasets: {', '.join(DATASETS)}")
+    return DATASETS[dataset]
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def flores_path(split):
+    return DATASETS["flores"].file(split)
+
+
+def udhr_path(path="udhr"):
+    return get_dataset(path).file()
 
-    with open(f"data/{path}/test.jsonl", "r", encoding="utf-8") as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
+
+def dataset_file(dataset, split=None):
+    """Return the path of a dataset's JSONL file and the name of its text field."""
+    info = get_dataset(dataset)
+    return info.file(split), info.text_field
+
+
+def iter_dataset(dataset, split=None):
+    """Stream the examples of a dataset."""
+    print(f"Streaming {dataset}{f' {split}' if split else ''} data...", file=sys.stderr)
+    return iter_jsonl(get_dataset(dataset).file(split))
+
+
+def load_dataset_examples(dataset, split=None):
+    print(f"Loading {dataset}{f' {split}' if split else ''} data...", file=sys.stderr)
+    data = list(iter_jsonl(get_dataset(dataset).file(split)))
 
     print(f"Loaded {len(data)} examples", file=sys.stderr)
     return data
+
+
+def iter_flores_data(split):
+    return iter_dataset("flores", split)
+
+
+def iter_udhr_data(path="udhr"):
+    return iter_dataset(path)
+
+
+def load_flores_data(split):
+    return load_dataset_examples("flores", split)
+
+
+def load_udhr_data(path="udhr"):
+    return load_dataset_examples(path)
@@ -4,18 +4,20 @@ import json
 import argparse
 import os
 import sys
-import jsonlines
-from collections import defaultdict, Counter
+from collections import defaultdict
 from dataclasses import dataclass
 
+import numpy as np
+
+from bootstrap import METRICS, bootstrap_macro_metrics, confidence_interval, paired_test
+from eval_datasets import DATASETS, get_dataset, iter_jsonl
+from jsonl_io import JsonlWriter
+from instrumentation import NO_INSTRUMENTATION, Instrumentation, add_instrumentation_arguments
+from prediction_store import GOLD, is_store, load_column, load_store_info, store_models
+
 
 def extract_language(example, dataset_type):
-    if dataset_type == "flores":
-        return f"{example['iso_639_3']}_{example['iso_15924']}"
-    elif dataset_type == "udhr":
-        return example['id']
-    else:
-        raise ValueError(f"Unknown dataset type: {dataset_type}")
+    return get_dataset(dataset_type).label(example)
 
 
 def load_languages_file(languages_file):
@@ -23,98 +25,318 @@ def load_languages_file(languages_file):
         return set(line.strip() for line in f if line.strip())
 
 
-def load_data(input_file, model, dataset_type):
+def wrong_file(input_file, model=None):
+    """Where the examples a model got wrong are written; with one model evaluated, the model is not in the name."""
+    root = input_file.rstrip(os.sep).split(os.extsep)[0]
+    return f"{root}_{model}_wrong.jsonl" if model else f"{root}_wrong.jsonl"
+
+
+def available_models(input_file):
+    if is_store(input_file):
+        return store_models(input_file)
+    return list(next(iter_jsonl(input_file))["predictions"])
+
+
+def new_label_index(labels=()):
+    # a label seen for the first time gets the number of labels seen before it
+    index = defaultdict()
+    index.default_factory = index.__len__
+    for label in labels:
+        index[label]
+    return index
+
+
+def encode(index, labels):
+    return np.fromiter(map(index.__getitem__, labels), dtype=np.int64, count=len(labels))
+
+
+def load_store_codes(store_path, models, dataset_type):
+    """Read the gold labels and the predictions of several models from a prediction store as label indices;
+    wrong predictions are written by row index."""
+    store_dataset = load_store_info(store_path)["dataset"]
+    if store_dataset != dataset_type:
+        raise ValueError(f"{store_path} holds predictions for {store_dataset}, not {dataset_type}")
+    # the gold column numbers its labels in order of first appearance already
+    gold_labels, gold_codes = load_column(store_path, GOLD)
+    index = new_label_index(gold_labels)
+    gold_codes = gold_codes.astype(np.int64)
+    model_codes = {}
+    for model in models:
+        pred_labels, pred_codes = load_column(store_path, model)
+        model_codes[model] = np.array([index[label] for label in pred_labels], dtype=np.int64)[pred_codes]
+    labels = list(index)
+
+    for model, pred_codes in model_codes.items():
+        with JsonlWriter(wrong_file(store_path, model if len(models) > 1 else None), ensure_ascii=True) as wrong:
+            for row in np.flatnonzero(gold_codes != pred_codes).tolist():
+                wrong.write({"row": row, "gold": labels[gold_codes[row]], "predictions": {model: labels[pred_codes[row]]}})
+    return labels, gold_codes, model_codes
+
+
+def load_codes(input_file, models, dataset_type):
+    """Read the gold labels and the predictions of several models in one pass, as indices into a label vocabulary
+    numbered in order of first appearance, golds first.
+
+    Returns the vocabulary, the gold label indices and the predicted label indices of every model. The examples
+    every model got wrong are written to its wrong_file().
+    """
+    if is_store(input_file):
+        return load_store_codes(input_file, models, dataset_type)
     y_true = []
-    y_pred = []
+    y_preds = {model: [] for model in models}
+
+    wrong_files = {model: JsonlWriter(wrong_file(input_file, model if len(models) > 1 else None), ensure_ascii=True) for model in models}
+    for example in iter_jsonl(input_file):
+        true_lang = extract_language(example, dataset_type)
+        y_true.append(true_lang)
+        predictions = example['predictions']
+        for model, y_pred in y_preds.items():
+            pred_lang = predictions[model]
+            if true_lang != pred_lang:
+                wrong_files[model].write(example)
+            y_pred.append(pred_lang)
+    for wrong in wrong_files.values():
+        wrong.close()
+
+    index = new_label_index()
+    gold_codes = encode(index, y_true)
+    model_codes = {model: encode(index, y_pred) for model, y_pred in y_preds.items()}
+    return list(index), gold_codes, model_codes
 
-    with open(input_file.split(os.extsep)[0] + "_wrong.jsonl", 'w') as wrong:
-        with jsonlines.open(input_file) as reader:
-            for example in reader:
-                true_lang = extract_language(example, dataset_type)
-                pred_lang = example['predictions'][model]
-                if true_lang != pred_lang:
-                    wrong.write(json.dumps(example) + '\n')
 
-                y_true.append(true_lang)
-                y_pred.append(pred_lang)
+def load_data(input_file, model, dataset_type):
+    labels, gold_codes, model_codes = load_codes(input_file, [model], dataset_type)
+    labels = np.array(labels, dtype=object)
+    return labels[gold_codes].tolist(), labels[model_codes[model]].tolist()
 
-    return y_true, y_pred
 
+def encode_labels(golds, preds):
+    """Number the gold and predicted labels with one vocabulary, in order of first appearance, golds first.
 
-def confusion_matrix(golds, preds):
-    cm = defaultdict(Counter)
-    for gold, pred in zip(golds, preds):
-        cm[gold][pred] += 1
-    return cm
+    Returns the vocabulary and the label indices of golds and preds.
+    """
+    index = new_label_index()
+    gold_codes, pred_codes = encode(index, golds), encode(index, preds)
+    return list(index), gold_codes, pred_codes
 
 
-def calculate_metrics(confusion_matrix, allowed_languages):
-    per_langauge = {}
+# above this many cells, the confusion matrix is counted with a sort instead of dense arrays
+MAX_DENSE_CELLS = 1 << 26
+
 
-    valid_decisions = 0  # all decisions done on supported target languages
-    for gold in confusion_matrix:
-        if gold not in allowed_languages:
-            continue
+def _sum_by(indices, counts, size):
+    return np.bincount(indices, weights=counts, minlength=size).astype(np.int64)
 
-        for pred in confusion_matrix[gold]:
-            valid_decisions += confusion_matrix[gold][pred]
 
-    for gold in confusion_matrix:
-        if gold not in allowed_languages:
-            continue
+@dataclass
+class ConfusionMatrix:
+    """The non-zero cells (gold index, predicted index, count) of a confusion matrix over a label vocabulary.
 
-        tp = confusion_matrix[gold][gold]
-        fn = sum(confusion_matrix[gold][lang] for lang in confusion_matrix[gold] if lang != gold)  # punish all false negatives when gold is supported
-        fp = sum(confusion_matrix[lang][gold] for lang in confusion_matrix if lang != gold and lang in allowed_languages)  # do not punish false positives when the target language is not supported
+    Gold indices are numbered in order of first appearance and the cells of every gold row are in the order
+    their first example appears, so that to_dict() is the dict of Counters filled example by example.
+    """
+    labels: list
+    golds: np.ndarray
+    preds: np.ndarray
+    counts: np.ndarray
 
-        real_negatives = valid_decisions - tp - fn
-        fpr = fp / real_negatives if real_negatives > 0 else 0
+    @classmethod
+    def from_codes(cls, labels, gold_codes, pred_codes):
+        num_labels = len(labels)
+        rows = gold_codes * num_labels + pred_codes
+        if num_labels * num_labels <= MAX_DENSE_CELLS:
+            counts = np.bincount(rows, minlength=num_labels * num_labels)
+            first_rows = np.full(num_labels * num_labels, len(rows))
+            np.minimum.at(first_rows, rows, np.arange(len(rows)))
+            cells = np.flatnonzero(counts)
+            counts, first_rows = counts[cells], first_rows[cells]
+        else:
+            cells, first_rows, counts = np.unique(rows, return_index=True, return_counts=True)
+        golds, preds = np.divmod(cells, num_labels)
+        order = np.lexsort((first_rows, golds))
+        return cls(labels, golds[order], preds[order], counts[order])
 
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+    def to_dict(self):
+        cm = {}
+        labels = self.labels
+        for gold, pred, count in zip(self.golds.tolist(), self.preds.tolist(), self.counts.tolist()):
+            cm.setdefault(labels[gold], {})[labels[pred]] = count
+        return cm
 
-        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
 
-        per_langauge[gold] = {"f1": f1, "tp": tp, "fn": fn, "fp": fp, "fpr": fpr, "precision": precision, "recall": recall}
+def confusion_matrix(golds, preds):
+    return ConfusionMatrix.from_codes(*encode_labels(golds, preds))
+
+
+def calculate_metrics(confusion_matrix, allowed_languages):
+    labels = confusion_matrix.labels
+    num_labels = len(labels)
+    allowed = np.array([label in allowed_languages for label in labels], dtype=bool)
+    golds, preds, counts = confusion_matrix.golds, confusion_matrix.preds, confusion_matrix.counts
+
+    gold_rows = np.unique(golds)
+    gold_rows = gold_rows[allowed[gold_rows]]
+    row_totals = _sum_by(golds, counts, num_labels)
+    valid_decisions = int(row_totals[gold_rows].sum())  # all decisions done on supported target languages
+
+    diagonal = golds == preds
+    tp = _sum_by(golds[diagonal], counts[diagonal], num_labels)[gold_rows]
+    fn = row_totals[gold_rows] - tp  # punish all false negatives when gold is supported
+    supported_rows = allowed[golds]
+    # do not punish false positives when the target language is not supported
+    fp = _sum_by(preds[supported_rows], counts[supported_rows], num_labels)[gold_rows] - tp
+
+    real_negatives = valid_decisions - tp - fn
+    # the metrics are computed element-wise in the same order as in Python, so the floats are the same; an
+    # undefined metric is the integer 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fpr = fp / real_negatives
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        precision_or_zero = np.where(tp + fp > 0, precision, 0)
+        recall_or_zero = np.where(tp + fn > 0, recall, 0)
+        f1 = 2 * precision_or_zero * recall_or_zero / (precision_or_zero + recall_or_zero)
+
+    per_langauge = {}
+    for gold, tp, fn, fp, real_negatives, fpr, precision, recall, f1 in zip(
+            gold_rows.tolist(), tp.tolist(), fn.tolist(), fp.tolist(), real_negatives.tolist(), fpr.tolist(),
+            precision.tolist(), recall.tolist(), f1.tolist()):
+        fpr = fpr if real_negatives > 0 else 0
+        precision = precision if (tp + fp) > 0 else 0
+        recall = recall if (tp + fn) > 0 else 0
+        f1 = f1 if (precision + recall) > 0 else 0
+        per_langauge[labels[gold]] = {"f1": f1, "tp": tp, "fn": fn, "fp": fp, "fpr": fpr, "precision": precision, "recall": recall}
 
     return per_langauge
 
 
-def evaluate_predictions(input_file, model, dataset_type, languages_file=None):
-    allowed_languages = load_languages_file(languages_file) if languages_file else None
-    golds, preds = load_data(input_file, model, dataset_type)
+def compute_results(golds, preds, allowed_languages):
+    return compute_confusion_matrix_results(confusion_matrix(golds, preds), allowed_languages)
 
-    cm = confusion_matrix(golds, preds)
-    per_lang_metrics = calculate_metrics(cm, allowed_languages)
 
+def compute_macro_averages(per_lang_metrics):
     macro_f1 = sum(per_lang_metrics[lang]["f1"] for lang in per_lang_metrics) / len(per_lang_metrics)
     macro_fpr = sum(per_lang_metrics[lang]["fpr"] for lang in per_lang_metrics) / len(per_lang_metrics)
     macro_precision = sum(per_lang_metrics[lang]["precision"] for lang in per_lang_metrics) / len(per_lang_metrics)
     macro_recall = sum(per_lang_metrics[lang]["recall"] for lang in per_lang_metrics) / len(per_lang_metrics)
     num_gold_examples = sum(per_lang_metrics[lang]["tp"] + per_lang_metrics[lang]["fn"] for lang in per_lang_metrics)
 
-    results = {
-        "macro_averages": {
-            "f1": macro_f1,
-            "fpr": macro_fpr,
-            "precision": macro_precision,
-            "recall": macro_recall,
-            "num_examples": num_gold_examples
-        },
+    return {
+        "f1": macro_f1,
+        "fpr": macro_fpr,
+        "precision": macro_precision,
+        "recall": macro_recall,
+        "num_examples": num_gold_examples
+    }
+
+
+def compute_confusion_matrix_results(cm, allowed_languages):
+    per_lang_metrics = calculate_metrics(cm, allowed_languages)
+
+    return {
+        "macro_averages": compute_macro_averages(per_lang_metrics),
         "per_language": per_lang_metrics,
-        "confusion_matrix": cm
+        "confusion_matrix": cm.to_dict()
     }
 
-    json.dump(results, sys.stdout, indent=2)
+
+def add_bootstrap_results(model_results, labels, gold_codes, model_codes, allowed_languages, num_resamples, confidence=0.95, seed=0,
+                          workers=1, paired_tests=()):
+    """Add bootstrap confidence intervals of the macro F1 and FPR of every model to its results, and paired tests
+    of model pairs (model, other model) to the results of the first model."""
+    samples = bootstrap_macro_metrics(labels, gold_codes, model_codes, allowed_languages, num_resamples, seed, workers)
+    for model, results in model_results.items():
+        bootstrap = {"resamples": num_resamples, "confidence": confidence, "seed": seed,
+                     **{metric: confidence_interval(samples[model][metric], confidence) for metric in METRICS}}
+        model_results[model] = {"macro_averages": results["macro_averages"], "bootstrap": bootstrap, **results}
+    for model, other_model in paired_tests:
+        macro_averages, other_macro_averages = model_results[model]["macro_averages"], model_results[other_model]["macro_averages"]
+        model_results[model]["bootstrap"].setdefault("paired_tests", {})[other_model] = {
+            metric: paired_test(samples[model][metric], samples[other_model][metric],
+                                macro_averages[metric] - other_macro_averages[metric], confidence)
+            for metric in METRICS
+        }
+
+
+def evaluate_predictions(input_file, models, dataset_type, languages_file=None, instrumentation=NO_INSTRUMENTATION, output=None,
+                         bootstrap=0, confidence=0.95, seed=0, bootstrap_workers=1, paired_tests=()):
+    """Evaluate one or more models (["all"] for every model in the file) from a single read of input_file.
+
+    The results of every model are written to output with {model} replaced by its name, or to stdout. With
+    bootstrap resamples, they include confidence intervals and the paired tests (see add_bootstrap_results).
+    """
+    if models == ["all"]:
+        models = available_models(input_file)
+    for model in {model for pair in paired_tests for model in pair} - set(models):
+        raise ValueError(f"Cannot test {model}, which is not evaluated")
+    allowed_languages = load_languages_file(languages_file) if languages_file else None
+    with instrumentation.profile():
+        with instrumentation.stage("read"):
+            labels, gold_codes, model_codes = load_codes(input_file, models, dataset_type)
+        instrumentation.add("read", 0, len(gold_codes), calls=0)
+
+        model_results = {}
+        for model, pred_codes in model_codes.items():
+            with instrumentation.stage("metrics", len(gold_codes)):
+                cm = ConfusionMatrix.from_codes(labels, gold_codes, pred_codes)
+                model_results[model] = compute_confusion_matrix_results(cm, allowed_languages)
+
+        if bootstrap:
+            with instrumentation.stage("bootstrap", bootstrap):
+                add_bootstrap_results(model_results, labels, gold_codes, model_codes, allowed_languages, bootstrap, confidence, seed,
+                                      bootstrap_workers, paired_tests)
+
+    with instrumentation.stage("write"):
+        for model, results in model_results.items():
+            if output:
+                path = output.format(model=model)
+                with open(path, "w") as f:
+                    json.dump(results, f, indent=2)
+                print(f"Saved the results of {model} to {path}", file=sys.stderr)
+            else:
+                json.dump(results, sys.stdout, indent=2)
+    instrumentation.report(len(gold_codes), script="evaluate", model=models if len(models) > 1 else models[0], dataset=dataset_type,
+                           input_file=input_file)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate language identification predictions")
-    parser.add_argument("input_file", help="Input JSONL file with predictions")
-    parser.add_argument("--model", required=True, help="Model name to evaluate")
+    parser.add_argument("input_file", help="Input JSONL file with predictions, or a prediction store directory (see prediction_store.py)")
+    parser.add_argument("--model", nargs="+", action="extend", dest="models", required=True,
+                        help="Model(s) to evaluate, or 'all' for every model in the input file; the file is read once")
+    parser.add_argument("--output", help="Write the results of every model to this path, with {model} replaced by the model name "
+                                         "(required with several models; default: stdout)")
     parser.add_argument("--languages-file", required=True, help="File containing list of languages to restrict evaluation to (one per line)")
-    parser.add_argument("--dataset", choices=["flores", "udhr"], required=True, help="Dataset type (flores or udhr)")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                        help="Dataset the predictions were made on, which defines the gold label fields (see eval_datasets.DATASETS)")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="RESAMPLES",
+                        help="Add confidence intervals of the macro F1 and FPR from this many bootstrap resamples (e.g. 10000)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the bootstrap intervals")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the bootstrap resamples")
+    parser.add_argument("--bootstrap-workers", type=int, default=1, help="Processes drawing the bootstrap resamples")
+    parser.add_argument("--paired-test", nargs=2, metavar=("MODEL", "OTHER_MODEL"), action="append", default=[], dest="paired_tests",
+                        help="Test the difference of the macro F1 and FPR of two evaluated models on the same resamples; "
+                             "the test is added to the results of MODEL")
+    add_instrumentation_arguments(parser)
 
 
     args = parser.parse_args()
-    evaluate_predictions(args.input_file, args.model, args.dataset, args.languages_file)
+    if "all" in args.models and len(args.models) > 1:
+        parser.error("--model all cannot be combined with other models")
+    if len(args.models) != len(set(args.models)):
+        parser.error("--model is given the same model twice")
+    if (len(args.models) > 1 or args.models == ["all"]) and (not args.output or "{model}" not in args.output):
+        parser.error("--output with {model} in it is required to evaluate several models")
+    if args.bootstrap < 0:
+        parser.error("--bootstrap must not be negative")
+    if args.paired_tests and not args.bootstrap:
+        parser.error("--paired-test requires --bootstrap")
+    if args.models != ["all"] and not {model for pair in args.paired_tests for model in pair} <= set(args.models):
+        parser.error("--paired-test models must be given to --model")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    if args.bootstrap_workers < 1:
+        parser.error("--bootstrap-workers must be positive")
+    evaluate_predictions(args.input_file, args.models, args.dataset, args.languages_file,
+                         Instrumentation(args.instrumentation_report, args.profile), args.output,
+                         args.bootstrap, args.confidence, args.seed, args.bootstrap_workers, args.paired_tests)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+from fasttext_numpy import FastTextNumpy
+from fasttext_predictions import resolve_model_path
+from prediction_cache import file_sha256
+
+
+def export_fasttext_model(model_name, model_path, out_dir):
+    """Convert a fastText .bin into a directory that FastTextNumpy (--engine numpy) memory-maps."""
+    model_path = resolve_model_path(model_name, model_path)
+    start_time = time.perf_counter()
+    model = FastTextNumpy(model_path)
+    print(f"Loaded {model_path} in {time.perf_counter() - start_time:.1f}s, exporting to {out_dir}...", file=sys.stderr)
+    # the checksum of the source lets the prediction cache share entries between the .bin and its export
+    model.export(out_dir, {"source": os.path.abspath(model_path), "source_sha256": file_sha256(model_path)})
+
+    start_time = time.perf_counter()
+    FastTextNumpy(out_dir)
+    print(f"Done; the export loads in {time.perf_counter() - start_time:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a fastText model to memory-mappable .npy arrays for --engine numpy")
+    parser.add_argument("--model", choices=["glotlid", "openlid", "openlid-v2", "retrained"], required=True)
+    parser.add_argument("--model-path", type=str,
+                       help="Path to local model file (required for retrained model)")
+    parser.add_argument("--out-dir", required=True, help="Directory to write the exported model to")
+
+    args = parser.parse_args()
+
+    export_fasttext_model(args.model, args.model_path, args.out_dir)
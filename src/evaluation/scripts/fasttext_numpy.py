@@ -0,0 +1,424 @@
+import json
+import mmap
+import os
+import struct
+
+import fasttext
+import numpy as np
+from topk_scores import FASTTEXT_PREFIX
+
+FASTTEXT_FILEFORMAT_MAGIC_INT32 = 793712314
+FASTTEXT_VERSION = 12
+EOS = b"</s>"
+BOW = b"<"
+EOW = b">"
+LABEL_PREFIX = FASTTEXT_PREFIX.encode()
+WORD_NGRAM_MULTIPLIER = np.uint64(116049371)
+SUPERVISED_MODEL = 3
+SOFTMAX_LOSS = 3
+BINARY_LOGISTIC_LOSSES = {2, 4}  # ns, ova
+SIGMOID_TABLE_SIZE = 512
+MAX_SIGMOID = 8
+# cached tokens are dropped all at once when there are more of them than this
+TOKEN_CACHE_SIZE = 1 << 20
+ENGINES = ["fasttext", "numpy"]
+# files of a model exported with export_fasttext_model.py
+EXPORT_METADATA = "model.json"
+EXPORT_ARRAYS = ["input_matrix", "output_matrix", "vocab_bytes", "vocab_offsets", "vocab_table", "pruneidx_keys", "pruneidx_values"]
+EXPORT_FORMAT_VERSION = 1
+MODEL_ARGS = ["dim", "word_ngrams", "loss", "model_type", "bucket", "minn", "maxn", "nwords", "nlabels", "pruneidx_size"]
+
+
+def softmax(scores):
+    exp_scores = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    return exp_scores / exp_scores.sum(axis=-1, keepdims=True)
+
+
+def top_k(probs, k):
+    """Indices of the k largest probabilities of every row, in decreasing order, without a full sort."""
+    k = min(k, probs.shape[1])
+    if k < probs.shape[1]:
+        candidates = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(probs.shape[1]), probs.shape)
+    order = np.argsort(-np.take_along_axis(probs, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def _sigmoid_table():
+    x = np.arange(SIGMOID_TABLE_SIZE + 1, dtype=np.float32) * np.float32(2 * MAX_SIGMOID) / np.float32(SIGMOID_TABLE_SIZE) - np.float32(MAX_SIGMOID)
+    return (1.0 / (1.0 + np.exp(-x.astype(np.float64)))).astype(np.float32)
+
+
+SIGMOID_TABLE = _sigmoid_table()
+
+
+def sigmoid(scores):
+    """fastText's table-based sigmoid (Loss::sigmoid)."""
+    indices = ((scores + np.float32(MAX_SIGMOID)) * np.float32(SIGMOID_TABLE_SIZE / MAX_SIGMOID / 2)).astype(np.int64)
+    probs = SIGMOID_TABLE[indices.clip(0, SIGMOID_TABLE_SIZE)]
+    probs[scores < -MAX_SIGMOID] = 0
+    probs[scores > MAX_SIGMOID] = 1
+    return probs
+
+
+def fnv1a_update(h, data):
+    """fastText's Dictionary::hash, continued from h; bytes are sign-extended as C++ chars are."""
+    for byte in data:
+        h = ((h ^ (byte | 0xFFFFFF00 if byte & 0x80 else byte)) * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def fnv1a(data):
+    return fnv1a_update(2166136261, data)
+
+
+class _Reader:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.buffer, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def array(self, dtype, count):
+        array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.pos).copy()
+        self.pos += array.nbytes
+        return array
+
+    def cstring(self):
+        end = self.buffer.find(b"\0", self.pos)
+        value = self.buffer[self.pos:end]
+        self.pos = end + 1
+        return value
+
+
+class VocabIndex:
+    """Read-only open-addressing hash table from dictionary words to their index, stored in flat arrays.
+
+    The words are concatenated in `data`, word i being data[offsets[i]:offsets[i + 1]]. `table` has a
+    power-of-two size and holds word indices (-1 for empty slots), placed by linear probing from fastText's
+    hash of the word. All three arrays can be memory-mapped, so that no per-word Python object is built.
+    """
+
+    def __init__(self, data, offsets, table):
+        self.data = data
+        self.offsets = offsets
+        self.table = table
+        self.mask = len(table) - 1
+
+    @classmethod
+    def build(cls, words):
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in words], out=offsets[1:])
+        data = np.frombuffer(b"".join(words), dtype=np.uint8)
+        # at most half full, so that probe sequences stay short
+        table = [-1] * (1 << (2 * len(words)).bit_length())
+        mask = len(table) - 1
+        for i, word in enumerate(words):
+            slot = fnv1a(word) & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = i
+        return cls(data, offsets, np.array(table, dtype=np.int32))
+
+    def find(self, word, h):
+        """Index of word, whose fnv1a hash is h, or -1."""
+        slot = h & self.mask
+        while (i := int(self.table[slot])) >= 0:
+            if self.data[self.offsets[i]:self.offsets[i + 1]].tobytes() == word:
+                return i
+            slot = (slot + 1) & self.mask
+        return -1
+
+
+class FastTextNumpy:
+    """Inference-only reimplementation of a supervised fastText model on top of NumPy.
+
+    Reads the .bin file directly and computes sentence vectors for a whole batch with one embedding
+    gather and a segmented sum, so that predict(list) costs a matrix product instead of one C++ call
+    per text. Results match the fasttext binding up to float rounding.
+
+    model_path can also be a directory written by export_fasttext_model.py. Its arrays are memory-mapped
+    read-only, so loading is almost instant and processes on one machine share the weights in the page cache.
+    """
+
+    def __init__(self, model_path):
+        self.word_ids = None
+        self.vocab_index = None
+        if os.path.isdir(model_path):
+            self._load_exported(model_path)
+        else:
+            with open(model_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                reader = _Reader(buffer)
+                self._load(reader)
+        self.pruneidx = dict(zip(self.pruneidx_keys.tolist(), self.pruneidx_values.tolist()))
+        self._token_cache = {}
+
+    def _load(self, reader):
+        magic, version = reader.unpack("<ii")
+        if magic != FASTTEXT_FILEFORMAT_MAGIC_INT32 or version > FASTTEXT_VERSION:
+            raise ValueError("Not a fastText model file or unsupported version")
+
+        (self.dim, _ws, _epoch, _min_count, _neg, self.word_ngrams, self.loss, self.model_type, self.bucket,
+         self.minn, self.maxn, _lr_update_rate, _t) = reader.unpack("<12id")
+        if self.model_type != SUPERVISED_MODEL:
+            raise ValueError("Only supervised fastText models can be loaded")
+        if self.loss != SOFTMAX_LOSS and self.loss not in BINARY_LOGISTIC_LOSSES:
+            raise ValueError("Hierarchical softmax models are not supported")
+        if version == 11:
+            # old supervised models do not use char n-grams
+            self.maxn = 0
+
+        size, self.nwords, self.nlabels = reader.unpack("<3i")
+        _ntokens, self.pruneidx_size = reader.unpack("<2q")
+        words = []
+        for _ in range(size):
+            words.append(reader.cstring())
+            reader.pos += 9  # int64 count, int8 entry type
+        self.word_ids = {word: i for i, word in enumerate(words)}
+        self.labels = [label.decode("utf-8") for label in words[self.nwords:]]
+        pruneidx = reader.array("<i4", 2 * max(self.pruneidx_size, 0)).reshape(-1, 2)
+        order = np.argsort(pruneidx[:, 0])
+        self.pruneidx_keys = pruneidx[order, 0].astype(np.int64)
+        self.pruneidx_values = pruneidx[order, 1].astype(np.int64)
+
+        self.input_matrix = self._matrix(reader)
+        self.output_matrix = self._matrix(reader)
+
+    def _load_exported(self, model_dir):
+        with open(os.path.join(model_dir, EXPORT_METADATA), encoding="utf-8") as f:
+            metadata = json.load(f)
+        if metadata["format_version"] != EXPORT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported exported model format version: {metadata['format_version']}")
+        for arg in MODEL_ARGS:
+            setattr(self, arg, metadata[arg])
+        self.labels = metadata["labels"]
+        arrays = {name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode="r") for name in EXPORT_ARRAYS}
+        self.input_matrix = arrays["input_matrix"]
+        self.output_matrix = arrays["output_matrix"]
+        self.vocab_index = VocabIndex(arrays["vocab_bytes"], arrays["vocab_offsets"], arrays["vocab_table"])
+        self.pruneidx_keys = np.asarray(arrays["pruneidx_keys"])
+        self.pruneidx_values = np.asarray(arrays["pruneidx_values"])
+
+    def export(self, model_dir, metadata=None):
+        """Write the model as .npy arrays and a JSON metadata file that FastTextNumpy(model_dir) memory-maps."""
+        if self.word_ids is None:
+            raise ValueError("Only models loaded from a .bin file can be exported")
+        os.makedirs(model_dir, exist_ok=True)
+        vocab_index = VocabIndex.build(list(self.word_ids))
+        arrays = {
+            "input_matrix": self.input_matrix,
+            "output_matrix": self.output_matrix,
+            "vocab_bytes": vocab_index.data,
+            "vocab_offsets": vocab_index.offsets,
+            "vocab_table": vocab_index.table,
+            "pruneidx_keys": self.pruneidx_keys,
+            "pruneidx_values": self.pruneidx_values,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(model_dir, f"{name}.npy"), array)
+        metadata = {**(metadata or {}), "format_version": EXPORT_FORMAT_VERSION, "labels": self.labels,
+                    **{arg: getattr(self, arg) for arg in MODEL_ARGS}}
+        # the metadata is written last, so a directory with a metadata file holds a complete export
+        tmp_path = os.path.join(model_dir, EXPORT_METADATA + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(model_dir, EXPORT_METADATA))
+
+    def _word_id(self, word, h):
+        if self.vocab_index is not None:
+            return self.vocab_index.find(word, h)
+        return self.word_ids.get(word, -1)
+
+    @staticmethod
+    def _matrix(reader):
+        (quantized,) = reader.unpack("<?")
+        if quantized:
+            raise ValueError("Quantized (.ftz) models are not supported")
+        rows, cols = reader.unpack("<2q")
+        return reader.array("<f4", rows * cols).reshape(rows, cols)
+
+    def get_labels(self):
+        return list(self.labels)
+
+    def get_dimension(self):
+        return self.dim
+
+    def get_input_matrix(self):
+        return self.input_matrix
+
+    def get_output_matrix(self):
+        return self.output_matrix
+
+    def _push_hash(self, ids, h):
+        if self.pruneidx_size == 0:
+            return
+        if self.pruneidx_size > 0:
+            if h not in self.pruneidx:
+                return
+            h = self.pruneidx[h]
+        ids.append(self.nwords + h)
+
+    def _char_ngrams(self, word):
+        """Input rows of the hashed character n-grams of a word, as Dictionary::computeSubwords."""
+        ids = []
+        if self.bucket == 0:
+            return ids
+        word = BOW + word + EOW
+        for i in range(len(word)):
+            if word[i] & 0xC0 == 0x80:
+                continue
+            h = 2166136261
+            j, n = i, 1
+            while j < len(word) and n <= self.maxn:
+                # extend the n-gram by one UTF-8 character
+                h = fnv1a_update(h, word[j:j + 1])
+                j += 1
+                while j < len(word) and word[j] & 0xC0 == 0x80:
+                    h = fnv1a_update(h, word[j:j + 1])
+                    j += 1
+                if n >= self.minn and not (n == 1 and (i == 0 or j == len(word))):
+                    self._push_hash(ids, h % self.bucket)
+                n += 1
+        return ids
+
+    def _token(self, token):
+        """Input rows and signed hash of a token, or None for labels, which are not part of the input."""
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        h = fnv1a(token)
+        wid = self._word_id(token, h)
+        if wid >= self.nwords or (wid < 0 and token.startswith(LABEL_PREFIX)):
+            result = False
+        else:
+            if wid < 0:
+                ids = [] if token == EOS else self._char_ngrams(token)
+            elif self.maxn <= 0 or token == EOS:
+                ids = [wid]
+            else:
+                ids = [wid] + self._char_ngrams(token)
+            # word hashes are stored as int32 and sign-extended before mixing
+            result = (ids, h - (1 << 32) if h & 0x80000000 else h)
+
+        if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+            self._token_cache.clear()
+        self._token_cache[token] = result
+        return result
+
+    def _word_ngram_ids(self, hashes, owners):
+        """Input rows of the hashed word n-grams of all texts of a batch, as Dictionary::addWordNgrams.
+
+        The n-grams come out in fastText's order (by first word, then by length), so that sentence vectors
+        are summed in the same order.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if self.word_ngrams <= 1 or self.pruneidx_size == 0 or self.bucket == 0 or len(hashes) == 0:
+            return empty, empty
+        hashes = hashes.astype(np.uint64)
+        # ngram_hashes[i, j - 1] is the hash of the n-gram of words i..i+j
+        ngram_hashes = np.zeros((len(hashes), self.word_ngrams - 1), dtype=np.uint64)
+        valid = np.zeros(ngram_hashes.shape, dtype=bool)
+        h = hashes
+        for j in range(1, min(self.word_ngrams, len(hashes))):
+            h = h[:-1] * WORD_NGRAM_MULTIPLIER + hashes[j:]
+            ngram_hashes[:-j, j - 1] = h
+            # n-grams must not cross into the next text
+            valid[:-j, j - 1] = owners[:-j] == owners[j:]
+        buckets = (ngram_hashes[valid] % np.uint64(self.bucket)).astype(np.int64)
+        ngram_owners = np.broadcast_to(owners[:, None], valid.shape)[valid]
+        if self.pruneidx_size > 0:
+            positions = np.searchsorted(self.pruneidx_keys, buckets).clip(max=len(self.pruneidx_keys) - 1)
+            kept = self.pruneidx_keys[positions] == buckets
+            buckets, ngram_owners = self.pruneidx_values[positions[kept]], ngram_owners[kept]
+        return self.nwords + buckets, ngram_owners
+
+    def _input_ids(self, texts):
+        """Input rows of every text in a batch, grouped by text, and the number of rows of every text."""
+        ids, owners, hashes, hash_owners = [], [], [], []
+        for i, text in enumerate(texts):
+            if "\n" in text:
+                raise ValueError("predict processes one line at a time (remove '\\n')")
+            tokens = text.encode("utf-8").replace(b"\0", b" ").split()
+            tokens.append(EOS)
+            for token in tokens:
+                result = self._token(token)
+                if result:
+                    token_ids, h = result
+                    ids.extend(token_ids)
+                    owners.extend([i] * len(token_ids))
+                    hashes.append(h)
+                    hash_owners.append(i)
+                # fastText stops reading the line at the first end-of-sentence token
+                if token == EOS:
+                    break
+
+        ngram_ids, ngram_owners = self._word_ngram_ids(np.array(hashes, dtype=np.int64), np.array(hash_owners, dtype=np.int64))
+        ids = np.concatenate([np.array(ids, dtype=np.int64), ngram_ids])
+        owners = np.concatenate([np.array(owners, dtype=np.int64), ngram_owners])
+        order = np.argsort(owners, kind="stable")
+        return ids[order], np.bincount(owners, minlength=len(texts))
+
+    def _sentence_vectors(self, texts):
+        ids, counts = self._input_ids(texts)
+        starts = np.cumsum(counts) - counts
+        # longest texts first, so that the texts still being summed at position p are a prefix
+        order = np.argsort(-counts, kind="stable")
+        sorted_counts, sorted_starts = counts[order], starts[order]
+        sums = np.zeros((len(texts), self.dim), dtype=np.float32)
+        # add the p-th input row of every text at once; fastText adds the rows of a text one by one in the
+        # same order, so the float32 sums are identical
+        for p in range(sorted_counts[0] if len(texts) else 0):
+            active = np.count_nonzero(sorted_counts > p)
+            sums[:active] += self.input_matrix[ids[sorted_starts[:active] + p]]
+
+        vectors = np.zeros_like(sums)
+        vectors[order] = sums
+        nonempty = counts > 0
+        vectors[nonempty] *= (1.0 / counts[nonempty]).astype(np.float32)[:, None]
+        return vectors, nonempty
+
+    def get_sentence_vectors(self, texts):
+        """Mean input vector of every text, (len(texts), dim); rows of texts without input are zero."""
+        return self._sentence_vectors(texts)[0]
+
+    def get_sentence_vector(self, text):
+        return self.get_sentence_vectors([text])[0]
+
+    def predict(self, text, k=1, threshold=0.0):
+        """Same inputs and outputs as fasttext's predict, for one text or a list of texts."""
+        single = isinstance(text, str)
+        texts = [text] if single else text
+        vectors, has_input = self._sentence_vectors(texts)
+        scores = vectors @ self.output_matrix.T
+        if self.loss == SOFTMAX_LOSS:
+            probs = softmax(scores)
+        else:
+            probs = sigmoid(scores)
+
+        all_labels, all_probs = [], []
+        top_k_indices = top_k(probs, k) if k > 0 else np.empty((len(texts), 0), dtype=np.int64)
+        for row_probs, row_indices, row_has_input in zip(probs, top_k_indices, has_input):
+            row_indices = row_indices[row_probs[row_indices] >= threshold] if row_has_input else row_indices[:0]
+            all_labels.append([self.labels[i] for i in row_indices])
+            # fastText reports exp(log(p + 1e-5))
+            all_probs.append(row_probs[row_indices] + np.float32(1e-5))
+
+        if single:
+            return tuple(all_labels[0]), all_probs[0].astype(np.float64)
+        return all_labels, all_probs
+
+
+def load_fasttext_model(model_path, engine="fasttext"):
+    """Load a model with the fasttext binding or, with engine="numpy", with FastTextNumpy."""
+    if engine == "numpy":
+        return FastTextNumpy(model_path)
+    if engine == "fasttext":
+        if os.path.isdir(model_path):
+            raise ValueError(f"{model_path} is an exported model, which can only be run with the numpy engine")
+        return fasttext.load_model(model_path)
+    raise ValueError(f"Unknown fastText engine: {engine}")
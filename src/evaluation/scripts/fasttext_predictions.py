@@ -1,22 +1,30 @@
 #!/usr/bin/env python3
 
-import json
-import fasttext
 import argparse
+import multiprocessing
 import sys
+import os
+import time
+from collections import deque
 
-import regex
 from huggingface_hub import hf_hub_download
-from eval_datasets import load_flores_data, load_udhr_data
+from cascade import CascadeModel
+from dedup import DEFAULT_DEDUP_MAX_ENTRIES, DedupModel
+from document_model import DocumentModel
+from eval_datasets import DATASETS, batched, dataset_file, get_dataset, iter_dataset
+from fasttext_numpy import ENGINES, load_fasttext_model
+from glotlid_cache import load_glotlid_top_k
 from glotlid_customlid import CustomLID
+from instrumentation import NO_INSTRUMENTATION, Instrumentation, add_instrumentation_arguments
+from jsonl_io import dumps
+from lid_client import RemoteModel, served_model_name
+from openlid_normer import normalize, normalize_batch
+from prediction_cache import DEFAULT_MAX_ENTRIES, CachedModel, PredictionCache
+from prediction_store import LabelColumnWriter, save_store
+from topk_scores import FASTTEXT_PREFIX, TopKScoresWriter
 
-# Regex patterns for text preprocessing
-# defines what we want to remove from string for langID
-NONWORD_REPLACE_STR = r"[^\p{Word}\p{Zs}]|\d"  # either (not a word nor a space) or (is digit)
-NONWORD_REPLACE_PATTERN = regex.compile(NONWORD_REPLACE_STR)
-SPACE_PATTERN = regex.compile(r"\s\s+")  # squeezes sequential whitespace
-
-FASTTEXT_PREFIX = "__label__"
+# models trained on text normalized with openlid_normer
+OPENLID_MODELS = ["openlid", "openlid-v2", "retrained"]
 
 def get_model_info(model_name):
     models = {
@@ -35,18 +43,32 @@ def get_model_info(model_name):
 def load_language_list(languages_file_path):
     with open(languages_file_path, 'r') as f:
         language_labels = [line.strip() for line in f if line.strip()]
-    return [f'__label__{label}' for label in language_labels]
+    return [FASTTEXT_PREFIX + label for label in language_labels]
 
 
 def preprocess_text(text):
-    text = text.replace('\n', ' ').strip().lower()
-    text = regex.sub(NONWORD_REPLACE_PATTERN, "", text)
-    text = regex.sub(SPACE_PATTERN, " ", text)
-    return text
+    # lowercase, remove non-word characters and digits, squeeze whitespace
+    return normalize(text)
+
+
+def predict_batch(model, texts, k=1):
+    """Predict top-k labels and probabilities for a list of texts in one call (fastText model, CustomLID or CachedModel)."""
+    return model.predict(texts, k=k)
 
 
-def predict_languages(dataset, model_name, split=None, languages_file=None, prediction_mode='before', enable_preprocessing=False, model_path=None):
+def resolve_label(labels, probs, restricted, threshold=None, glotlid_langs=None):
+    if restricted:
+        return labels[0].replace(FASTTEXT_PREFIX, "")
+    if (not threshold) or (probs[0] > threshold):
+        pred_lang = labels[0].replace(FASTTEXT_PREFIX, "")
+    else:
+        pred_lang = 'zxx_Zxxx'
+    if glotlid_langs is not None and pred_lang not in glotlid_langs:
+        pred_lang = 'zxx_Zxxx'
+    return pred_lang
+
 
+def resolve_model_path(model_name, model_path=None):
     repo_id, filename = get_model_info(model_name)
 
     if model_path:
@@ -56,114 +78,347 @@ def predict_languages(dataset, model_name, split=None, languages_file=None, pred
         model_path = hf_hub_download(repo_id=repo_id, filename=filename)
     else:
         raise ValueError(f"No model path provided and no HuggingFace info for model: {model_name}")
+    return model_path
 
+
+def load_model(model_name, model_path=None, languages_file=None, prediction_mode='before', matrix_dtype='float32', engine='fasttext'):
+    """Load a fastText model, or a CustomLID restricted to the languages in languages_file."""
+    model_path = resolve_model_path(model_name, model_path)
     print(f"Loading model from {model_path}...", file=sys.stderr)
 
     # Load languages from file if provided
-    languages_list = None
     if languages_file is not None:
         print(f"Loading languages from {languages_file}...", file=sys.stderr)
         languages_list = load_language_list(languages_file)
         print(f"Loaded {len(languages_list)} languages: {languages_list[:5]}{'...' if len(languages_list) > 5 else ''}", file=sys.stderr)
-
-    if languages_list is not None:
-        model = CustomLID(model_path, languages=languages_list, mode=prediction_mode)
+        return CustomLID(model_path, languages=languages_list, mode=prediction_mode, matrix_dtype=matrix_dtype, engine=engine)
+    return load_fasttext_model(model_path, engine)
+
+
+def cache_predictions(model, cache, model_path, enable_preprocessing, languages_file=None, prediction_mode='before', matrix_dtype='float32',
+                      engine='fasttext'):
+    """Wrap a loaded model so that its predictions are looked up in and stored to a PredictionCache."""
+    languages_list = load_language_list(languages_file) if languages_file is not None else None
+    namespace = cache.namespace(model_path, enable_preprocessing, languages_list, prediction_mode, matrix_dtype, engine)
+    return CachedModel(model, cache, namespace, predict_batch)
+
+
+def load_dataset(dataset, split=None):
+    """Return a lazy iterator over the examples of a dataset and the name of its text field."""
+    _, text_field = dataset_file(dataset, split)
+    return iter_dataset(dataset, split), text_field
+
+
+def predict_labels(texts, models, ensemble=None, threshold=None, start=0, scores_k=0, instrumentation=NO_INSTRUMENTATION):
+    """Predict the final language label of every text in a batch with every model.
+
+    models is a list of (model, enable_preprocessing) pairs. The texts are normalized at most once
+    and the GlotLID ensemble labels are shared, whatever the number of models.
+    ensemble provides the GlotLID top-k languages of the texts, which start at row start of the dataset.
+    Returns one list of labels per model and, per model, the raw top-scores_k (labels, probs) or None.
+    """
+    glotlid_langs = [None] * len(texts)
+    if ensemble is not None:
+        with instrumentation.stage("ensemble", len(texts)):
+            glotlid_langs = ensemble.top_k_langs(texts, start)
+
+    preprocessed_texts = None
+    model_labels, model_scores = [], []
+    for model, enable_preprocessing in models:
+        if enable_preprocessing and preprocessed_texts is None:
+            with instrumentation.stage("preprocess", len(texts)):
+                preprocessed_texts = normalize_batch(texts)
+
+        restricted = getattr(model, "restricted", False)
+        with instrumentation.stage("predict", len(texts)):
+            batch_labels, batch_probs = predict_batch(model, preprocessed_texts if enable_preprocessing else texts, k=max(1, scores_k))
+        model_labels.append([
+            resolve_label(labels, probs, restricted, threshold, ensemble_langs)
+            for labels, probs, ensemble_langs in zip(batch_labels, batch_probs, glotlid_langs)
+        ])
+        model_scores.append((batch_labels, batch_probs) if scores_k else None)
+    return model_labels, model_scores
+
+
+# set by the parent before forking so that workers share the loaded models copy-on-write
+_worker_predictor_kwargs = {}
+
+
+def _predict_labels_in_worker(texts, start):
+    return predict_labels(texts, start=start, **_worker_predictor_kwargs)
+
+
+def iter_predicted_batches(batches, text_field, workers=1, **predictor_kwargs):
+    """Yield (batch, (labels per model, scores per model)) pairs in input order.
+
+    With workers > 1, every batch is a contiguous shard predicted by a forked worker process.
+    At most two shards per worker are in flight, so memory does not grow with the input.
+    """
+    if workers == 1:
+        start = 0
+        for batch in batches:
+            yield batch, predict_labels([example[text_field] for example in batch], start=start, **predictor_kwargs)
+            start += len(batch)
+        return
+
+    global _worker_predictor_kwargs
+    _worker_predictor_kwargs = predictor_kwargs
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        pending = deque()
+        start = 0
+        for batch in batches:
+            texts = [example[text_field] for example in batch]
+            pending.append((batch, pool.apply_async(_predict_labels_in_worker, (texts, start))))
+            start += len(batch)
+            if len(pending) >= 2 * workers:
+                batch, result = pending.popleft()
+                yield batch, result.get()
+        while pending:
+            batch, result = pending.popleft()
+            yield batch, result.get()
+    _worker_predictor_kwargs = {}
+
+
+def warn_if_preprocessing_disabled(model_name, enable_preprocessing):
+    if not enable_preprocessing and model_name in OPENLID_MODELS:
+        print("!" * 80, file=sys.stderr)
+        print(f"Warning! Disabled preprocessing for openLID model {model_name}", file=sys.stderr)
+        print("!" * 80, file=sys.stderr)
+
+
+def scores_file(scores_path, model_name, num_models):
+    if num_models == 1:
+        return scores_path
+    root, ext = os.path.splitext(scores_path)
+    return f"{root}.{model_name}{ext or '.npz'}"
+
+
+def run_predictions(dataset, split, models, out_path="", threshold=None, ensemble_with_glotlid_k=0, batch_size=1, workers=1,
+                    glotlid_cache_dir=None, scores_path=None, scores_k=0, instrumentation=NO_INSTRUMENTATION, dedup=False,
+                    store_path=None, store_probs=False, dedup_max_entries=DEFAULT_DEDUP_MAX_ENTRIES):
+    """Predict a dataset with several loaded models in a single pass.
+
+    models is a list of (name, model, enable_preprocessing). With out_path, every example is written
+    with a predictions dict holding one label per model; otherwise the labels are printed tab-separated,
+    unless they go to store_path only. With store_path, the gold labels and the labels of every model
+    (with store_probs, also the model's top probability) are saved as columns (see prediction_store).
+    With scores_path, the raw top-scores_k labels and probabilities of every model are saved too
+    (see topk_scores), for offline threshold/ensemble sweeps. With dedup, GlotLID is run once per distinct
+    text for the ensemble (the dedup_max_entries most recent texts are remembered); the models themselves are
+    deduplicated by wrapping them in DedupModel.
+    """
+    ensemble = None
+    if ensemble_with_glotlid_k:
+        with instrumentation.stage("load_ensemble"):
+            ensemble = load_glotlid_top_k(*dataset_file(dataset, split), ensemble_with_glotlid_k, glotlid_cache_dir, batch_size, dedup,
+                                          dedup_max_entries)
+
+    data, text_field = load_dataset(dataset, split)
+    print(f"Processing examples in batches of {batch_size} with {workers} worker(s)...", file=sys.stderr)
+
+    # examples are streamed and written batch by batch, so memory does not grow with the dataset
+    writer = open(out_path, 'w') if out_path else None
+    model_names = [name for name, _, _ in models]
+    num_processed = 0
+    start_time = time.perf_counter()
+    # reading and parsing happen in the main process while the batches are pulled, so they are timed there
+    predicted_batches = iter_predicted_batches(
+        instrumentation.timed_iter("read", batched(data, batch_size)), text_field, workers,
+        models=[(model, enable_preprocessing) for _, model, enable_preprocessing in models],
+        ensemble=ensemble, threshold=threshold, scores_k=scores_k if scores_path else int(store_probs), instrumentation=instrumentation
+    )
+    model_scores_writers = [TopKScoresWriter(scores_k, getattr(model, "restricted", False)) for _, model, _ in models] if scores_path else []
+    if store_path:
+        gold_label = get_dataset(dataset).label
+        gold_writer = LabelColumnWriter()
+        column_writers = [LabelColumnWriter() for _ in models]
+    with instrumentation.profile():
+        for batch, (model_labels, model_scores) in predicted_batches:
+            if num_processed % 10000 < batch_size:
+                print(f"Processed {num_processed} examples...", file=sys.stderr)
+
+            with instrumentation.stage("write", len(batch)):
+                if writer or not store_path:
+                    lines = []
+                    for i, example in enumerate(batch):
+                        if writer:
+                            predictions = example.setdefault("predictions", {})
+                            for model_name, labels in zip(model_names, model_labels):
+                                predictions[model_name] = labels[i]
+                            lines.append(dumps(example) + '\n')
+                        else:
+                            lines.append('\t'.join(labels[i] for labels in model_labels) + '\n')
+                    (writer or sys.stdout).write(''.join(lines))
+                if store_path:
+                    gold_writer.add([gold_label(example) for example in batch])
+                    for column_writer, labels, scores in zip(column_writers, model_labels, model_scores):
+                        column_writer.add(labels, [float(probs[0]) for probs in scores[1]] if store_probs else None)
+                num_processed += len(batch)
+                for scores_writer, scores in zip(model_scores_writers, model_scores):
+                    scores_writer.add(*scores)
+
+    if writer:
+        writer.close()
+    for model_name, scores_writer in zip(model_names, model_scores_writers):
+        path = scores_file(scores_path, model_name, len(models))
+        scores_writer.save(path)
+        print(f"Saved top-{scores_k} scores of {model_name} to {path}", file=sys.stderr)
+    if store_path:
+        save_store(store_path, dataset, split, gold_writer, dict(zip(model_names, column_writers)))
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Completed processing {num_processed} examples in {elapsed:.2f}s "
+          f"({num_processed / elapsed if elapsed > 0 else 0:.1f} examples/sec)", file=sys.stderr)
+    if isinstance(getattr(ensemble, "model", None), DedupModel):
+        ensemble.model.report()
+    return num_processed
+
+
+def predict_languages(dataset, model_name, split=None, languages_file=None, prediction_mode='before', enable_preprocessing=False, model_path=None,
+                      out_path="", threshold=None, ensemble_with_glotlid_k=0, batch_size=1, workers=1, glotlid_cache_dir=None,
+                      scores_path=None, scores_k=0, prediction_cache_path=None, prediction_cache_max_entries=DEFAULT_MAX_ENTRIES,
+                      matrix_dtype='float32', engine='fasttext', server=None, cascade=None, document_mode=False, window_chars=500,
+                      max_windows=None, instrumentation=NO_INSTRUMENTATION, dedup=False, store_path=None, store_probs=False,
+                      dedup_max_entries=DEFAULT_DEDUP_MAX_ENTRIES):
+
+    cache = None
+    if server:
+        # the restriction list, mode, precision and engine are those the server was started with
+        model = RemoteModel(server, served_model_name(model_name, languages_file is not None))
     else:
-        model = fasttext.load_model(model_path)
+        model_path = resolve_model_path(model_name, model_path)
+        with instrumentation.stage("load_model"):
+            model = load_model(model_name, model_path, languages_file, prediction_mode, matrix_dtype, engine)
+    if prediction_cache_path:
+        cache = PredictionCache(prediction_cache_path, prediction_cache_max_entries)
+        model = cache_predictions(model, cache, model_path, enable_preprocessing, languages_file, prediction_mode, matrix_dtype, engine)
+    # wrappers that count their work in shared memory and report it at the end
+    reporting_models = []
+    if cascade:
+        model = CascadeModel(model, [(name, path, load_language_list(file)) for name, path, file in cascade], engine)
+        if workers > 1:
+            # loaded once here and shared copy-on-write, instead of once per worker
+            with instrumentation.stage("load_model"):
+                model.load_specialists()
+        reporting_models.append(model)
+    if document_mode:
+        model = DocumentModel(model, window_chars, max_windows)
+        reporting_models.append(model)
+    if dedup:
+        # the model gets preprocessed texts, so duplicates are detected after preprocessing
+        model = DedupModel(model, model_name, dedup_max_entries)
+        reporting_models.append(model)
+    warn_if_preprocessing_disabled(model_name, enable_preprocessing)
+    num_processed = run_predictions(dataset, split, [(model_name, model, enable_preprocessing)], out_path=out_path, threshold=threshold,
+                                    ensemble_with_glotlid_k=ensemble_with_glotlid_k, batch_size=batch_size, workers=workers,
+                                    glotlid_cache_dir=glotlid_cache_dir, scores_path=scores_path, scores_k=scores_k,
+                                    instrumentation=instrumentation, dedup=dedup, store_path=store_path, store_probs=store_probs,
+                                    dedup_max_entries=dedup_max_entries)
+    for reporting_model in reporting_models:
+        reporting_model.report()
+    instrumentation.report(num_processed, script="fasttext_predictions", model=model_name, dataset=dataset, split=split,
+                           batch_size=batch_size, workers=workers, engine=engine)
+    if cache is not None:
+        cache.close()
+
+
+def add_model_arguments(parser):
+    parser.add_argument("--languages-file", type=str,
+                       help="Path to file containing language labels (one per line, e.g., eng_Latn)")
+    parser.add_argument("--prediction-mode", choices=["before", "after", "script"], default="before",
+                       help="Prediction mode for CustomLID: 'before' (limit before softmax), 'after' (limit after softmax) "
+                            "or 'script' (limit before softmax to the labels written in the scripts found in each text)")
+    parser.add_argument("--engine", choices=ENGINES, default="fasttext",
+                       help="Run the models with the fasttext binding or with the batched NumPy reimplementation (fasttext_numpy.py)")
+    parser.add_argument("--matrix-dtype", choices=["float32", "float16", "int8"], default="float32",
+                       help="Precision of the CustomLID output matrix (int8 uses a per-row scale)")
 
-    non_flores = {
-        "udhr", "fastspell", "setimes", "parlasent", "he_bcs_ge_full", "ITDI_2022", "hplt", "hrv_Latn-was-wrong",
-        "bos_Latn-was-wrong", "srp_Cyrl-was-wrong", "nob_Latn-was-wrong"
-    }
-    if dataset == "flores":
-        if split is None:
-            raise ValueError("Split must be specified for FLORES+ dataset")
-        data = load_flores_data(split)
-    elif dataset in non_flores:
-        data = load_udhr_data(path=dataset)
-    else:
-        raise ValueError(f"Unknown dataset: {dataset}. Available datasets: flores, {non_flores}")
-
-    print(f"Processing {len(data)} examples...", file=sys.stderr)
-    results = []
-    if args.ensemble_with_glotlid_k:
-        ensemble_model_path = hf_hub_download(repo_id="cis-lmu/glotlid", filename="model.bin")
-        ensemble_model = fasttext.load_model(ensemble_model_path)
-
-    for i, example in enumerate(data):
-        if i % 10000 == 0:
-            print(f"Processed {i}/{len(data)} examples...", file=sys.stderr)
-
-        if dataset == "flores":
-            text_content = example["text"]
-        else:
-            text_content = example["sentence"]
-
-        if not enable_preprocessing and model_name in ["openlid", "openlid-v2", "retrained"]:
-            print("!" * 80, file=sys.stderr)
-            print("Warning! Disabled preprocessing for openLID model", file=sys.stderr)
-            print("!" * 80, file=sys.stderr)
-
-        if args.ensemble_with_glotlid_k:
-            pred = ensemble_model.predict(text_content, k=args.ensemble_with_glotlid_k)[0]
-            glotlid_langs = [pred_lang.removeprefix("__label__") for pred_lang in pred]
-
-        if enable_preprocessing:
-            text_content = preprocess_text(text_content)
-
-        if languages_list is not None:
-            pred_labels, pred_probs = model.predict(text_content, k=1)
-            pred = pred_labels[0]
-            pred_lang = pred.replace(FASTTEXT_PREFIX, "")
-        else:
-            pred, pred_probs = model.predict(text_content, k=1)
-            if (pred_probs[0] > 0.5) or (not args.threshold):
-                pred_lang = pred[0].replace(FASTTEXT_PREFIX, "")
-            else:
-                pred_lang = 'zxx_Zxxx'
-            if args.ensemble_with_glotlid_k and (pred_lang not in glotlid_langs):
-                pred_lang = 'zxx_Zxxx'
-        result = example.copy()
-        if "predictions" not in result:
-            result["predictions"] = {}
-        result["predictions"][model_name] = pred_lang
-        results.append(result)
-        if not args.out_path:
-            print(pred_lang)
-
-    print(f"Completed processing {len(results)} examples", file=sys.stderr)
-
-    if args.out_path:
-        with open(args.out_path, 'w') as writer:
-            for result in results:
-                writer.write(json.dumps(result, ensure_ascii=False)+'\n')
+
+def add_run_arguments(parser):
+    parser.add_argument("--ensemble_with_glotlid_k", type=int, default=0)
+    parser.add_argument("--glotlid-cache-dir", type=str,
+                       help="Directory with cached GlotLID top-k predictions for the ensemble (built on first use)")
+    parser.add_argument("--threshold", nargs="?", type=float, const=0.5, default=None,
+                       help="Predict zxx_Zxxx when the top probability is not above this value (0.5 if given without a value)")
+    parser.add_argument("--scores-k", type=int, default=5,
+                       help="Number of labels to keep per example in --scores-path")
+    parser.add_argument("--prediction-cache", type=str, dest="prediction_cache_path",
+                       help="SQLite file caching predictions by model checksum, preprocessing, restriction list and text")
+    parser.add_argument("--prediction-cache-max-entries", type=int, default=DEFAULT_MAX_ENTRIES,
+                       help="Least recently used predictions above this number are evicted at the end of the run")
+    parser.add_argument("--server", type=str,
+                       help="URL of a running lid_server.py serving the models, to send the examples to instead of loading them")
+    parser.add_argument("--batch-size", type=int, default=1,
+                       help="Number of examples to preprocess and predict per model call")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Number of forked worker processes; each batch is a shard, so use a large --batch-size")
+
+
+def check_run_arguments(parser, args):
+    if args.batch_size < 1:
+        parser.error("--batch-size must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+    if args.scores_k < 1:
+        parser.error("--scores-k must be positive")
+    if args.server and args.prediction_cache_path:
+        parser.error("--prediction-cache cannot be used with --server")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run fastText-based language identification predictions")
-    parser.add_argument("--dataset", choices=[
-        "flores", "udhr", "fastspell", "setimes", "parlasent", "he_bcs_ge_full", "ITDI_2022", "hplt",
-        "hrv_Latn-was-wrong", "bos_Latn-was-wrong", "srp_Cyrl-was-wrong", "nob_Latn-was-wrong"
-    ], required=True,
-                       help="Dataset to process (flores or udhr)")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                       help="Dataset to process (see eval_datasets.DATASETS)")
     parser.add_argument("--model", choices=["glotlid", "openlid", "openlid-v2", "retrained"], required=True,
                        help="Model to use (glotlid, openlid, openlid-v2, or retrained)")
     parser.add_argument("--split", choices=["dev", "devtest"],
                        help="Data split to process (required for FLORES+ dataset)")
-    parser.add_argument("--languages-file", type=str,
-                       help="Path to file containing language labels (one per line, e.g., eng_Latn)")
-    parser.add_argument("--prediction-mode", choices=["before", "after"], default="before",
-                       help="Prediction mode for CustomLID: 'before' (limit before softmax) or 'after' (limit after softmax)")
+    add_model_arguments(parser)
     parser.add_argument("--enable-preprocessing", action="store_true",
                        help="Enable text preprocessing (lowercase, normalize spaces, remove non-word characters)")
     parser.add_argument("--model-path", type=str,
                        help="Path to local model file (required for retrained model)")
     parser.add_argument("--out_path", type=str, default="")
-    parser.add_argument("--ensemble_with_glotlid_k", type=int, default=0)
-    parser.add_argument("--threshold", action="store_true")
+    parser.add_argument("--store", type=str, dest="store_path",
+                       help="Also (or instead of --out_path) save the gold labels and the predicted labels as columns in this "
+                            "directory (see prediction_store.py); runs of other models on the same dataset add their column")
+    parser.add_argument("--store-probs", action="store_true",
+                       help="Also save the top probability of the model for every example in --store")
+    parser.add_argument("--scores-path", type=str,
+                       help="Also save the raw top-k labels and probabilities per example to this .npz file (see sweep_thresholds.py)")
+    parser.add_argument("--cascade", nargs=3, metavar=("NAME", "MODEL_PATH", "LANGUAGES_FILE"), action="append",
+                       help="Re-predict texts whose top label is in LANGUAGES_FILE with the specialist model at MODEL_PATH; "
+                            "repeat for every specialist")
+    parser.add_argument("--document-mode", action="store_true",
+                       help="Predict texts longer than --window-chars as windows, voting with their probabilities and "
+                            "stopping once the leading label cannot be overtaken")
+    parser.add_argument("--window-chars", type=int, default=500,
+                       help="Largest window in document mode, in characters")
+    parser.add_argument("--max-windows", type=int,
+                       help="Only consider this many windows per document in document mode, spread over the document")
+    parser.add_argument("--dedup", action="store_true",
+                       help="Predict every distinct (preprocessed) text once and copy the result to its duplicates")
+    parser.add_argument("--dedup-max-entries", type=int, default=DEFAULT_DEDUP_MAX_ENTRIES,
+                       help="With --dedup, remember the predictions of at most this many distinct texts (least recently seen are dropped)")
+    add_run_arguments(parser)
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
     if args.dataset == "flores" and args.split is None:
         parser.error("--split is required when --dataset is flores")
-
-    predict_languages(args.dataset, args.model, args.split, args.languages_file, args.prediction_mode, args.enable_preprocessing, args.model_path)
+    check_run_arguments(parser, args)
+    if args.window_chars < 1:
+        parser.error("--window-chars must be positive")
+    if args.max_windows is not None and args.max_windows < 1:
+        parser.error("--max-windows must be positive")
+    if args.store_probs and not args.store_path:
+        parser.error("--store-probs requires --store")
+    if args.dedup_max_entries < 1:
+        parser.error("--dedup-max-entries must be positive")
+
+    predict_languages(args.dataset, args.model, args.split, args.languages_file, args.prediction_mode, args.enable_preprocessing, args.model_path,
+                      args.out_path, args.threshold, args.ensemble_with_glotlid_k, args.batch_size, args.workers, args.glotlid_cache_dir,
+                      args.scores_path, args.scores_k, args.prediction_cache_path, args.prediction_cache_max_entries, args.matrix_dtype,
+                      args.engine, args.server, args.cascade, args.document_mode, args.window_chars, args.max_windows,
+                      Instrumentation(args.instrumentation_report, args.profile, shared_stages=["ensemble", "preprocess", "predict"]),
+                      args.dedup, args.store_path, args.store_probs, args.dedup_max_entries)
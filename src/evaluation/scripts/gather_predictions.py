@@ -1,17 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
-import jsonlines
 from collections import defaultdict
-from eval_datasets import load_flores_data, load_udhr_data
+from eval_datasets import DATASETS, get_dataset, load_dataset_examples
+from jsonl_io import JsonlWriter
+from prediction_store import LabelColumnWriter, save_store
 
 
-def main(dataset_type, split, predictions_list, output_file):
+def main(dataset_type, split, predictions_list, output_file=None, store_path=None):
 
-    if dataset_type == "flores":
-        dataset = load_flores_data(split)
-    elif dataset_type == "udhr":
-        dataset = load_udhr_data()
+    dataset = load_dataset_examples(dataset_type, split)
 
     predictions = defaultdict(list)
 
@@ -23,7 +21,17 @@ def main(dataset_type, split, predictions_list, output_file):
         if len(predictions[model_name]) != len(dataset):
             raise ValueError(f"Prediction file {pred_file} has {len(predictions[model_name])} lines but dataset has {len(dataset)} examples")
 
-    with jsonlines.open(output_file, 'w') as writer:
+    if store_path:
+        gold_writer = LabelColumnWriter()
+        gold_writer.add(get_dataset(dataset_type).label(example) for example in dataset)
+        column_writers = {model_name: LabelColumnWriter() for model_name in predictions}
+        for model_name, column_writer in column_writers.items():
+            column_writer.add(predictions[model_name])
+        save_store(store_path, dataset_type, split, gold_writer, column_writers)
+    if not output_file:
+        return
+
+    with JsonlWriter(output_file) as writer:
         for i, example in enumerate(dataset):
             output_example = example.copy()
             output_example['predictions'] = {}
@@ -36,14 +44,18 @@ def main(dataset_type, split, predictions_list, output_file):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--dataset", choices=["flores", "udhr"], required=True)
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True)
     parser.add_argument("--split", choices=["dev", "devtest"])
     parser.add_argument("--prediction", nargs=2, metavar=("MODEL", "FILE"), dest="predictions", action="append", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--output")
+    parser.add_argument("--store", help="Also (or instead of --output) save the gold labels and the predictions as columns "
+                                        "in this directory (see prediction_store.py)")
 
     args = parser.parse_args()
 
     if args.dataset == "flores" and not args.split:
         parser.error("--split is required for flores dataset")
+    if not args.output and not args.store:
+        parser.error("--output or --store is required")
 
-    main(args.dataset, args.split, args.predictions, args.output)
+    main(args.dataset, args.split, args.predictions, args.output, args.store)
@@ -3,18 +3,15 @@
 import json
 import argparse
 import sys
-import jsonlines
+from eval_datasets import flores_path
+from jsonl_io import JsonlWriter, read_jsonl
 from transformers import AutoTokenizer, AutoModelForMaskedLM, AutoModelForSequenceClassification
 import torch
 
 
 def load_data(split):
     print(f"Loading {split} data...", file=sys.stderr)
-    data = []
-
-    with open(f"data/flores_plus/{split}.jsonl", "r", encoding="utf-8") as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
+    data = read_jsonl(flores_path(split))
 
     print(f"Loaded {len(data)} examples", file=sys.stderr)
     return data
@@ -85,9 +82,8 @@ def predict_languages(split, model_path=None):
 
     print(f"Completed processing {len(results)} examples", file=sys.stderr)
 
-    with jsonlines.Writer(sys.stdout) as writer:
-        for result in results:
-            writer.write(result)
+    with JsonlWriter(sys.stdout) as writer:
+        writer.write_all(results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import os
+import sys
+
+import fasttext
+from huggingface_hub import hf_hub_download
+from dedup import DEFAULT_DEDUP_MAX_ENTRIES, DedupModel
+from eval_datasets import DATASETS, batched, dataset_file, iter_jsonl
+from topk_scores import FASTTEXT_PREFIX, PADDING, TopKScoresWriter, load_top_k
+
+
+def load_glotlid_model():
+    print("Loading GlotLID model for the ensemble...", file=sys.stderr)
+    model_path = hf_hub_download(repo_id="cis-lmu/glotlid", filename="model.bin")
+    return fasttext.load_model(model_path)
+
+
+def dataset_content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_file(cache_dir, content_hash, k):
+    return os.path.join(cache_dir, f"glotlid-{content_hash[:32]}-k{k}.npz")
+
+
+class GlotLIDTopK:
+    """GlotLID top-k languages predicted on the fly (raw, unpreprocessed text)."""
+
+    def __init__(self, model, k):
+        self.model = model
+        self.k = k
+
+    def top_k_langs(self, texts, start):
+        labels, _ = self.model.predict(texts, k=self.k)
+        return [[label.removeprefix(FASTTEXT_PREFIX) for label in text_labels] for text_labels in labels]
+
+
+class CachedGlotLIDTopK:
+    """GlotLID top-k languages looked up by row index in a cache built for one dataset file (see topk_scores)."""
+
+    def __init__(self, path):
+        self.labels, self.indices, self.probs = load_top_k(path)
+        self.k = self.indices.shape[1]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def top_k_langs(self, texts, start):
+        rows = self.indices[start:start + len(texts)]
+        if len(rows) != len(texts):
+            raise ValueError(f"GlotLID cache has {len(self)} rows, the dataset has more")
+        return [[self.labels[index] for index in row if index != PADDING] for row in rows]
+
+
+def build_glotlid_cache(path, examples, text_field, k, model=None, batch_size=1000):
+    model = model or load_glotlid_model()
+    scores = TopKScoresWriter(k)
+    for batch in batched(examples, batch_size):
+        scores.add(*model.predict([example[text_field] for example in batch], k=k))
+    scores.save(path)
+    print(f"Saved GlotLID top-{k} predictions for {len(scores)} examples to {path}", file=sys.stderr)
+
+
+def load_glotlid_top_k(dataset_path, text_field, k, cache_dir=None, batch_size=1000, dedup=False, dedup_max_entries=DEFAULT_DEDUP_MAX_ENTRIES):
+    """Return the GlotLID top-k source for the ensemble.
+
+    Without cache_dir, GlotLID is loaded and run on every batch, once per distinct raw text with dedup.
+    With cache_dir, the top-k of the dataset file is computed once, stored under its content hash and k,
+    and looked up on later runs without loading GlotLID.
+    """
+    if cache_dir is None:
+        model = load_glotlid_model()
+        return GlotLIDTopK(DedupModel(model, "GlotLID ensemble", dedup_max_entries) if dedup else model, k)
+
+    path = cache_file(cache_dir, dataset_content_hash(dataset_path), k)
+    if not os.path.exists(path):
+        print(f"No GlotLID cache for {dataset_path} at {path}, building it...", file=sys.stderr)
+        build_glotlid_cache(path, iter_jsonl(dataset_path), text_field, k, batch_size=batch_size)
+    print(f"Using GlotLID top-{k} cache {path}", file=sys.stderr)
+    return CachedGlotLIDTopK(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the GlotLID top-k cache used by --ensemble_with_glotlid_k")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                       help="Dataset to process (see eval_datasets.DATASETS)")
+    parser.add_argument("--split", choices=["dev", "devtest"],
+                       help="Data split to process (required for FLORES+ dataset)")
+    parser.add_argument("--k", type=int, required=True, help="Number of GlotLID labels to keep per example")
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    if args.dataset == "flores" and args.split is None:
+        parser.error("--split is required when --dataset is flores")
+
+    dataset_path, text_field = dataset_file(args.dataset, args.split)
+    load_glotlid_top_k(dataset_path, text_field, args.k, args.cache_dir, args.batch_size)
@@ -1,9 +1,56 @@
-import fasttext
 import numpy as np
+
+from fasttext_numpy import load_fasttext_model, softmax, top_k
+from script_profiler import ScriptProfiler, label_script, unicode_scripts
+
+# float16 and int8 rows are upcast to float32 this many at a time, so the full float32 matrix never exists
+SCORE_CHUNK_ROWS = 1024
+
+
+class OutputMatrix:
+    """Output matrix rows stored as float32, float16 or int8 with a per-row scale."""
+
+    def __init__(self, matrix, dtype="float32"):
+        self.dtype = dtype
+        if dtype == "float32":
+            self.weights = np.ascontiguousarray(matrix, dtype=np.float32)
+            self.scale = None
+        elif dtype == "float16":
+            self.weights = matrix.astype(np.float16)
+            self.scale = None
+        elif dtype == "int8":
+            max_abs = np.abs(matrix).max(axis=1)
+            self.scale = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+            self.weights = np.round(matrix / self.scale[:, None]).astype(np.int8)
+        else:
+            raise ValueError(f"Unknown output matrix dtype: {dtype}")
+        self._buffer = None
+
+    @property
+    def nbytes(self):
+        return self.weights.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def scores(self, vectors):
+        if self.weights.dtype == np.float32:
+            return vectors @ self.weights.T
+        if self._buffer is None:
+            self._buffer = np.empty((min(SCORE_CHUNK_ROWS, len(self.weights)), self.weights.shape[1]), dtype=np.float32)
+        scores = np.empty((len(vectors), len(self.weights)), dtype=np.float32)
+        for start in range(0, len(self.weights), SCORE_CHUNK_ROWS):
+            chunk = self.weights[start:start + SCORE_CHUNK_ROWS]
+            buffer = self._buffer[:len(chunk)]
+            np.copyto(buffer, chunk)
+            np.matmul(vectors, buffer.T, out=scores[:, start:start + len(chunk)])
+            if self.scale is not None:
+                scores[:, start:start + len(chunk)] *= self.scale[start:start + len(chunk)]
+        return scores
+
+
 class CustomLID:
-    def __init__(self, model_path, languages = -1, mode='before'):
-        self.model = fasttext.load_model(model_path)
-        self.output_matrix = self.model.get_output_matrix()
+    restricted = True
+
+    def __init__(self, model_path, languages = -1, mode='before', matrix_dtype='float32', engine='fasttext'):
+        self.model = load_fasttext_model(model_path, engine)
         self.labels = self.model.get_labels()
 
         # compute language_indices
@@ -16,47 +63,122 @@ class CustomLID:
         # limit labels to language_indices
         self.labels = list(np.array(self.labels)[self.language_indices])
 
-        # predict
-        self.predict = self.predict_limit_after_softmax if mode=='after' else self.predict_limit_before_softmax
+        # only the rows the softmax runs over are kept, copied once here instead of on every prediction
+        output_matrix = self.model.get_output_matrix()
+        if mode != 'after':
+            output_matrix = output_matrix[self.language_indices, :]
+        self.output_matrix = OutputMatrix(output_matrix, matrix_dtype)
+        if mode == 'script':
+            self._init_script_gating(output_matrix, matrix_dtype)
 
+        # predict
+        if mode == 'after':
+            self.predict = self.predict_limit_after_softmax
+        elif mode == 'script':
+            self.predict = self.predict_script_gated
+        else:
+            self.predict = self.predict_limit_before_softmax
+
+    def _init_script_gating(self, output_matrix, matrix_dtype):
+        """Group the restricted labels by the Unicode scripts of their ISO 15924 code and precompute one
+        output matrix per script. Labels whose script the profiler does not know (und_Zxxx, ...) are in every group."""
+        label_scripts = [unicode_scripts(label_script(label)) for label in self.labels]
+        self.script_profiler = ScriptProfiler({script for scripts in label_scripts for script in scripts})
+        script_index = {script: i for i, script in enumerate(self.script_profiler.scripts)}
+        self.script_label_indices = [[] for _ in script_index]
+        self.ungated_label_indices = []
+        for i, scripts in enumerate(label_scripts):
+            known_scripts = [script for script in scripts if script in script_index]
+            if not known_scripts:
+                self.ungated_label_indices.append(i)
+            for script in known_scripts:
+                self.script_label_indices[script_index[script]].append(i)
+
+        self._gated_output_rows = output_matrix
+        self._matrix_dtype = matrix_dtype
+        self._script_output_matrices = {}
+        for i in range(len(script_index)):
+            signature = np.zeros(len(script_index), dtype=bool)
+            signature[i] = True
+            self._script_output_matrix(signature)
+
+    def _script_output_matrix(self, signature):
+        """Label indices and output matrix for texts containing the scripts in the boolean signature.
+
+        Mixed-script signatures get the union of the groups, built on first use; texts without
+        characters of any known script are scored against all restricted labels."""
+        if not signature.any():
+            return np.arange(len(self.labels)), self.output_matrix
+        key = signature.tobytes()
+        if key not in self._script_output_matrices:
+            label_indices = set(self.ungated_label_indices)
+            for i in np.flatnonzero(signature):
+                label_indices.update(self.script_label_indices[i])
+            label_indices = np.array(sorted(label_indices), dtype=np.int64)
+            self._script_output_matrices[key] = (label_indices,
+                                                 OutputMatrix(self._gated_output_rows[label_indices], self._matrix_dtype))
+        return self._script_output_matrices[key]
+
+    def sentence_vectors(self, texts):
+        if hasattr(self.model, "get_sentence_vectors"):
+            return self.model.get_sentence_vectors(texts)
+        return np.stack([self.model.get_sentence_vector(text) for text in texts])
+
+    def _top_k_predictions(self, probs, k, single):
+        top_k_indices = top_k(probs, k)
+        top_k_labels = [tuple(self.labels[i] for i in row) for row in top_k_indices]
+        top_k_probs = list(np.take_along_axis(probs, top_k_indices, axis=1))
+        if single:
+            return top_k_labels[0], top_k_probs[0]
+        return top_k_labels, top_k_probs
 
     def predict_limit_before_softmax(self, text, k=1):
+        """Softmax over the restricted labels only.
 
-        # sentence vector
-        sentence_vector = self.model.get_sentence_vector(text)
-
-        # dot
-        result_vector = np.dot(self.output_matrix[self.language_indices, :], sentence_vector)
-
-        # softmax
-        softmax_result = np.exp(result_vector - np.max(result_vector)) / np.sum(np.exp(result_vector - np.max(result_vector)))
+        Like fasttext's predict, takes a text or a list of texts; a list is scored with one matrix product.
+        """
+        single = isinstance(text, str)
+        sentence_vectors = self.sentence_vectors([text] if single else text)
 
-        # top k predictions
-        top_k_indices = np.argsort(softmax_result)[-k:][::-1]
-        top_k_labels = [self.labels[i] for i in top_k_indices]
-        top_k_probs = softmax_result[top_k_indices]
-
-        return tuple(top_k_labels), top_k_probs
+        # dot + softmax
+        probs = softmax(self.output_matrix.scores(sentence_vectors))
 
+        return self._top_k_predictions(probs, k, single)
 
     def predict_limit_after_softmax(self, text, k=1):
-
-        # sentence vector
-        sentence_vector = self.model.get_sentence_vector(text)
-
-        # dot
-        result_vector = np.dot(self.output_matrix, sentence_vector)
-
-        # softmax
-        softmax_result = np.exp(result_vector - np.max(result_vector)) / np.sum(np.exp(result_vector - np.max(result_vector)))
-
-        # limit softmax to language_indices
-        softmax_result = softmax_result[self.language_indices]
-
-
-        # top k predictions
-        top_k_indices = np.argsort(softmax_result)[-k:][::-1]
-        top_k_labels = [self.labels[i] for i in top_k_indices]
-        top_k_probs = softmax_result[top_k_indices]
-
-        return tuple(top_k_labels), top_k_probs
+        """Softmax over all labels, then limited to the restricted ones."""
+        single = isinstance(text, str)
+        sentence_vectors = self.sentence_vectors([text] if single else text)
+
+        # dot + softmax, then limit softmax to language_indices
+        probs = softmax(self.output_matrix.scores(sentence_vectors))[:, self.language_indices]
+
+        return self._top_k_predictions(probs, k, single)
+
+    def predict_script_gated(self, text, k=1):
+        """Softmax over the restricted labels written in the scripts found in each text.
+
+        Texts of a batch are grouped by the set of scripts they contain, so every group is scored with one
+        matrix product over its precomputed sub-matrix.
+        """
+        single = isinstance(text, str)
+        texts = [text] if single else text
+        sentence_vectors = self.sentence_vectors(texts)
+
+        signatures, groups = np.unique(self.script_profiler.profile(texts) > 0, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        top_k_labels, top_k_probs = [None] * len(texts), [None] * len(texts)
+        for group, signature in enumerate(signatures):
+            rows = np.flatnonzero(groups == group)
+            label_indices, output_matrix = self._script_output_matrix(signature)
+            probs = softmax(output_matrix.scores(sentence_vectors[rows]))
+            top_k_indices = top_k(probs, k)
+            # labels outside the group have probability 0, and fill the top k as in the ungated modes
+            others = np.setdiff1d(np.arange(len(self.labels)), label_indices)[:k - len(label_indices)] if k > len(label_indices) else []
+            other_labels = tuple(self.labels[i] for i in others)
+            for row, indices, row_probs in zip(rows, top_k_indices, np.take_along_axis(probs, top_k_indices, axis=1)):
+                top_k_labels[row] = tuple(self.labels[label_indices[i]] for i in indices) + other_labels
+                top_k_probs[row] = np.pad(row_probs, (0, len(other_labels))) if other_labels else row_probs
+        if single:
+            return top_k_labels[0], top_k_probs[0]
+        return top_k_labels, top_k_probs
@@ -0,0 +1,132 @@
+import cProfile
+import contextlib
+import json
+import multiprocessing
+import pstats
+import resource
+import sys
+import time
+
+_END = object()
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Instrumentation:
+    """Opt-in wall time, example counts and examples/sec per stage of a run, plus model load time and peak RSS.
+
+    Does nothing unless report_path or profile_path is given. The stages listed in shared_stages are counted
+    in shared memory, so that time spent in forked worker processes is included; other stages are created on
+    first use in the process that uses them. report() writes the JSON report to report_path and profile()
+    wraps the hot loop in cProfile, dumping its stats to profile_path.
+    """
+
+    def __init__(self, report_path=None, profile_path=None, shared_stages=()):
+        self.report_path = report_path
+        self.profile_path = profile_path
+        self.enabled = bool(report_path or profile_path)
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        if self.enabled:
+            for name in shared_stages:
+                self._stage_counters(name)
+
+    def _stage_counters(self, name):
+        if name not in self.stages:
+            self.stages[name] = (multiprocessing.Value("d", 0), multiprocessing.Value("q", 0), multiprocessing.Value("q", 0))
+        return self.stages[name]
+
+    def add(self, name, seconds, num_examples=0, calls=1):
+        """Add to a stage; with calls=0, e.g. examples only known once the stage is done."""
+        if not self.enabled:
+            return
+        stage_seconds, stage_calls, stage_examples = self._stage_counters(name)
+        with stage_seconds.get_lock():
+            stage_seconds.value += seconds
+        with stage_calls.get_lock():
+            stage_calls.value += calls
+        with stage_examples.get_lock():
+            stage_examples.value += num_examples
+
+    @contextlib.contextmanager
+    def _timed(self, name, num_examples):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time, num_examples)
+
+    def stage(self, name, num_examples=0):
+        """Context manager adding its wall time and num_examples to a stage."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed(name, num_examples)
+
+    def timed_iter(self, name, iterable, count=len):
+        """Yield the items of iterable, adding the time spent producing them (e.g. reading and parsing) and
+        count(item) examples to a stage."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start_time = time.perf_counter()
+            item = next(iterator, _END)
+            if item is _END:
+                return
+            self.add(name, time.perf_counter() - start_time, count(item))
+            yield item
+
+    @contextlib.contextmanager
+    def profile(self):
+        if not self.profile_path:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profile_path)
+            print(f"Saved cProfile stats to {self.profile_path}; top functions by cumulative time:", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+
+    def report(self, num_examples=None, **extra):
+        """Write the JSON report; num_examples is the number of examples of the whole run."""
+        if not self.report_path:
+            return
+        total_seconds = time.perf_counter() - self.start_time
+        stages = {}
+        for name, (seconds, calls, examples) in self.stages.items():
+            if not calls.value:
+                continue
+            stages[name] = {"seconds": seconds.value, "calls": calls.value, "examples": examples.value,
+                            "examples_per_sec": examples.value / seconds.value if examples.value and seconds.value > 0 else None}
+        report = {
+            **extra,
+            "total_seconds": total_seconds,
+            "num_examples": num_examples,
+            "examples_per_sec": num_examples / total_seconds if num_examples else None,
+            "stages": stages,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+        with open(self.report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved instrumentation report to {self.report_path}", file=sys.stderr)
+
+
+# default for functions called with and without instrumentation
+NO_INSTRUMENTATION = Instrumentation()
+
+
+def add_instrumentation_arguments(parser):
+    parser.add_argument("--instrumentation-report", type=str,
+                       help="Write wall time per stage, examples/sec, model load time and peak RSS to this JSON file")
+    parser.add_argument("--profile", type=str,
+                       help="Dump cProfile stats of the main loop to this file (only the main process)")
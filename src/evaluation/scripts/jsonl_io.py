@@ -0,0 +1,137 @@
+import gzip
+import io
+import json
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# bytes read from a file at once; lines are split and decoded from these blocks
+BLOCK_SIZE = 1 << 20
+# a writer flushes its lines to the file once this many characters are buffered
+WRITE_BUFFER_SIZE = 1 << 20
+
+# the output of json.dumps(obj, ensure_ascii=...), which is also what jsonlines writes, without building an
+# encoder for every line. orjson is only used for decoding: its output differs (separators, floats, NaN)
+_ENCODERS = {
+    False: json.JSONEncoder(ensure_ascii=False).encode,
+    True: json.JSONEncoder().encode,
+}
+
+
+def codec_name():
+    return "orjson" if orjson is not None else "json"
+
+
+def open_binary(path):
+    """Open a possibly gzip- or zstd-compressed file for streaming, decompressing as it is read."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Reading {path} requires the zstandard package") from None
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
+
+def open_text(path):
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8")
+
+
+def loads(line):
+    """Decode one JSON line (str or UTF-8 bytes) like json.loads, except that orjson reads integers beyond 64 bits
+    as floats (ids and labels of the benchmarks are far from that)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # what orjson rejects but json accepts: NaN, Infinity, lone surrogates
+            pass
+    return json.loads(line)
+
+
+def dumps(obj, ensure_ascii=False):
+    """Encode obj like json.dumps(obj, ensure_ascii=ensure_ascii)."""
+    return _ENCODERS[ensure_ascii](obj)
+
+
+def iter_lines(path, block_size=BLOCK_SIZE):
+    """Yield the non-blank lines of a (possibly compressed) file as bytes, reading it in blocks."""
+    with open_binary(path) as f:
+        rest = b""
+        while block := f.read(block_size):
+            end = block.rfind(b"\n")
+            if end < 0:
+                rest += block
+                continue
+            lines = (rest + block[:end]).split(b"\n")
+            rest = block[end + 1:]
+            yield from (line for line in lines if line and not line.isspace())
+        if rest and not rest.isspace():
+            yield rest
+
+
+def iter_jsonl(path, block_size=BLOCK_SIZE):
+    """Lazily yield the objects of a (possibly compressed) JSONL file; blank lines are skipped."""
+    if orjson is None:
+        # json.loads on str skips detecting the encoding of every line
+        for line in iter_lines(path, block_size):
+            yield json.loads(line.decode("utf-8"))
+        return
+    for line in iter_lines(path, block_size):
+        yield loads(line)
+
+
+def read_jsonl(path):
+    return list(iter_jsonl(path))
+
+
+class JsonlWriter:
+    """Writes objects as JSON lines, as jsonlines and json.dumps(obj, ensure_ascii=False) do.
+
+    Takes a path or an open text file (e.g. sys.stdout, which is not closed). Lines are buffered and written
+    in blocks, so nothing may be written to the same file directly while the writer is open.
+    """
+
+    def __init__(self, file=None, ensure_ascii=False):
+        if file is None:
+            file = sys.stdout
+        self.should_close = isinstance(file, str)
+        self.file = open(file, "w", encoding="utf-8") if self.should_close else file
+        self.encode = _ENCODERS[ensure_ascii]
+        self.lines = []
+        self.buffered = 0
+
+    def write(self, obj):
+        line = self.encode(obj)
+        self.lines.append(line)
+        self.buffered += len(line)
+        if self.buffered >= WRITE_BUFFER_SIZE:
+            self.flush()
+
+    def write_all(self, objs):
+        for obj in objs:
+            self.write(obj)
+
+    def flush(self):
+        if self.lines:
+            self.lines.append("")
+            self.file.write("\n".join(self.lines))
+            self.lines = []
+            self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.should_close:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
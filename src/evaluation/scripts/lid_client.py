@@ -0,0 +1,59 @@
+import http.client
+import json
+import os
+import urllib.parse
+
+import numpy as np
+
+
+def served_model_name(model_name, restricted=False):
+    """Name under which lid_server.py serves a model, or its CustomLID-restricted variant."""
+    return f"{model_name}-restricted" if restricted else model_name
+
+
+class RemoteModel:
+    """A model served by lid_server.py, with the same predict(texts, k) interface as the loaded models.
+
+    Requests go over one keep-alive connection per process, so the model can be used from forked workers.
+    """
+
+    def __init__(self, server_url, model_name, timeout=600):
+        url = urllib.parse.urlsplit(server_url)
+        self.server_url = server_url.rstrip("/")
+        self.host, self.port = url.hostname, url.port
+        self.model_name = model_name
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+        models = self._request("GET", "/models")
+        if model_name not in models:
+            raise ValueError(f"{self.server_url} does not serve {model_name}; it serves {', '.join(models)}")
+        self.restricted = models[model_name]["restricted"]
+
+    @property
+    def connection(self):
+        if self._pid != os.getpid():
+            self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._pid = os.getpid()
+        return self._connection
+
+    def _request(self, method, path, payload=None):
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        # the server may have closed an idle keep-alive connection; requests are idempotent, so retry once
+        for attempt in range(2):
+            try:
+                self.connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"{self.server_url}{path}: {response.status} {data.decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def predict(self, texts, k=1):
+        result = self._request("POST", "/predict", {"model": self.model_name, "texts": list(texts), "k": k})
+        return result["labels"], [np.array(probs, dtype=result["dtype"]) for probs in result["probs"]]
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from fasttext_predictions import add_model_arguments, get_model_info, load_model, resolve_model_path
+from lid_client import served_model_name
+
+
+class MicroBatcher:
+    """Runs the predict requests of one model on a single thread, merging the ones that arrive together.
+
+    A batch is closed when it holds max_batch_size texts or max_wait seconds after its first request,
+    whichever comes first, so a lone request waits at most max_wait before it is predicted.
+    """
+
+    def __init__(self, model, max_batch_size, max_wait):
+        self.model = model
+        self.restricted = getattr(model, "restricted", False)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.num_batches = 0
+        self.num_texts = 0
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, texts, k):
+        if not texts:
+            return [], []
+        future = Future()
+        self.queue.put((texts, k, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            requests = [self.queue.get()]
+            num_texts = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while num_texts < self.max_batch_size:
+                try:
+                    request = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                requests.append(request)
+                num_texts += len(request[0])
+            self._predict(requests)
+
+    def _predict(self, requests):
+        requests_by_k = defaultdict(list)
+        for request in requests:
+            requests_by_k[request[1]].append(request)
+
+        for k, k_requests in requests_by_k.items():
+            texts = [text for request_texts, _, _ in k_requests for text in request_texts]
+            try:
+                labels, probs = self.model.predict(texts, k=k)
+            except Exception as e:
+                for _, _, future in k_requests:
+                    future.set_exception(e)
+                continue
+            self.num_batches += 1
+            self.num_texts += len(texts)
+            start = 0
+            for request_texts, _, future in k_requests:
+                end = start + len(request_texts)
+                future.set_result((labels[start:end], probs[start:end]))
+                start = end
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # every client thread or worker holds a keep-alive connection
+    request_queue_size = 128
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """GET /models lists the served models; POST /predict {"model", "texts", "k"} returns their labels and probabilities."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; without this, Nagle's algorithm delays keep-alive responses
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/models":
+            self._send_json(200, {name: {"restricted": batcher.restricted, "batches": batcher.num_batches, "texts": batcher.num_texts}
+                                  for name, batcher in self.server.batchers.items()})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = self.headers["Content-Length"]
+            if length is None or int(length) < 0:
+                raise ValueError("a valid Content-Length is required")
+            request = json.loads(self.rfile.read(int(length)))
+            if not isinstance(request, dict):
+                raise ValueError("the request must be a JSON object")
+            batcher = self.server.batchers[request["model"]]
+            texts, k = request["texts"], request.get("k", 1)
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts must be a list of strings")
+            # rejected here rather than by the model, where it would fail the whole batch
+            if any("\n" in text for text in texts):
+                raise ValueError("texts must not contain newlines")
+            if not isinstance(k, int) or k < 1:
+                raise ValueError("k must be a positive integer")
+        except KeyError as e:
+            self._send_json(400, {"error": f"Missing or unknown {e}"})
+            return
+        except (TypeError, ValueError) as e:
+            # TypeError: a field of the wrong type, e.g. an unhashable model name
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            labels, probs = batcher.predict(texts, k)
+        except Exception as e:
+            self._send_json(500, {"error": repr(e)})
+            return
+        dtype = str(probs[0].dtype) if probs else "float32"
+        self._send_json(200, {"labels": [list(text_labels) for text_labels in labels],
+                              "probs": [np.asarray(text_probs).tolist() for text_probs in probs],
+                              "dtype": dtype})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(model_specs, restricted_model_specs, languages_file=None, prediction_mode='before', matrix_dtype='float32', engine='fasttext',
+          host="127.0.0.1", port=8765, max_batch_size=256, max_wait_ms=5, verbose=False):
+    """Load the models once and serve them over HTTP until interrupted."""
+    batchers = {}
+    for specs, restricted in ((model_specs, False), (restricted_model_specs, True)):
+        for model_name, model_path in specs:
+            model_path = resolve_model_path(model_name, model_path)
+            model = load_model(model_name, model_path, languages_file if restricted else None, prediction_mode, matrix_dtype, engine)
+            batchers[served_model_name(model_name, restricted)] = MicroBatcher(model, max_batch_size, max_wait_ms / 1000)
+
+    server = PredictionServer((host, port), PredictionHandler)
+    server.batchers = batchers
+    server.verbose = verbose
+    print(f"Serving {', '.join(batchers)} on http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_model_specs(parser, specs):
+    model_specs = []
+    for spec in specs or []:
+        if len(spec) > 2:
+            parser.error(f"--model takes a model name and an optional path, got {spec}")
+        try:
+            get_model_info(spec[0])
+        except ValueError as e:
+            parser.error(str(e))
+        model_specs.append((spec[0], spec[1] if len(spec) == 2 else None))
+    return model_specs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fastText-based language identification models over HTTP with micro-batching")
+    parser.add_argument("--model", nargs="+", metavar=("MODEL", "MODEL_PATH"), dest="models", action="append",
+                       help="Model to serve, optionally followed by the path to a local model file; repeat for every model")
+    parser.add_argument("--restricted-model", nargs="+", metavar=("MODEL", "MODEL_PATH"), dest="restricted_models", action="append",
+                       help="Model to serve as CustomLID restricted to --languages-file, under the name <MODEL>-restricted")
+    add_model_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=256,
+                       help="Largest number of texts predicted in one model call")
+    parser.add_argument("--max-wait-ms", type=float, default=5,
+                       help="How long a request may wait for others to join its batch")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    model_specs = parse_model_specs(parser, args.models)
+    restricted_model_specs = parse_model_specs(parser, args.restricted_models)
+    if not model_specs and not restricted_model_specs:
+        parser.error("at least one --model or --restricted-model is required")
+    if restricted_model_specs and args.languages_file is None:
+        parser.error("--restricted-model requires --languages-file")
+    if args.max_batch_size < 1:
+        parser.error("--max-batch-size must be positive")
+
+    serve(model_specs, restricted_model_specs, args.languages_file, args.prediction_mode, args.matrix_dtype, args.engine,
+          args.host, args.port, args.max_batch_size, args.max_wait_ms, args.verbose)
@@ -1,9 +1,23 @@
 #!/usr/bin/env python3
 
 import argparse
-import jsonlines
 from collections import defaultdict
 
+from jsonl_io import iter_jsonl
+from prediction_store import GOLD, is_store, load_labels
+
+
+def iter_labels(input_file, flores, models):
+    """Yield the gold label and the labels of the two models of every example."""
+    if is_store(input_file):
+        # only the gold and the two prediction columns are read
+        yield from zip(*(load_labels(input_file, name) for name in [GOLD, *models]))
+        return
+    for example in iter_jsonl(input_file):
+        label = example["id"] if not flores else f"{example['iso_639_3']}_{example['iso_15924']}"
+        predictions = example['predictions']
+        yield label, predictions[models[0]], predictions[models[1]]
+
 
 def list_disagreements(input_file, flores, models):
     disagreements_by_id = defaultdict(int)
@@ -15,24 +29,21 @@ def list_disagreements(input_file, flores, models):
     total_disagreements = 0
     total_examples = 0
 
-    with jsonlines.open(input_file) as reader:
-        for example in reader:
-            total_examples += 1
-            label = example["id"] if not flores else f"{example['iso_639_3']}_{example['iso_15924']}"
-            predictions = example['predictions']
-
-            if predictions[models[0]] != predictions[models[1]]:
-                total_disagreements += 1
-                disagreements_by_id[label] += 1
-
-                if predictions[models[0]] == label:
-                    model1_correct_by_id[label] += 1
-                    model2_wrong_predictions[label][predictions[models[1]]] += 1
-                elif predictions[models[1]] == label:
-                    model2_correct_by_id[label] += 1
-                    model1_wrong_predictions[label][predictions[models[0]]] += 1
-                else:
-                    both_wrong_by_id[label] += 1
+    for label, prediction1, prediction2 in iter_labels(input_file, flores, models):
+        total_examples += 1
+
+        if prediction1 != prediction2:
+            total_disagreements += 1
+            disagreements_by_id[label] += 1
+
+            if prediction1 == label:
+                model1_correct_by_id[label] += 1
+                model2_wrong_predictions[label][prediction2] += 1
+            elif prediction2 == label:
+                model2_correct_by_id[label] += 1
+                model1_wrong_predictions[label][prediction1] += 1
+            else:
+                both_wrong_by_id[label] += 1
 
     print(f"Total examples: {total_examples}")
     print(f"Total disagreements: {total_disagreements}")
@@ -60,8 +71,8 @@ def list_disagreements(input_file, flores, models):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_file", help="Input merged JSONL file")
-    parser.add_argument("--flores", action="store_true", help="Use iso_639_3 and iso_15924 fields instead of id")
+    parser.add_argument("input_file", help="Input merged JSONL file, or a prediction store directory (see prediction_store.py)")
+    parser.add_argument("--flores", action="store_true", help="Use iso_639_3 and iso_15924 fields instead of id (JSONL only)")
     parser.add_argument("--models", nargs=2, metavar=("MODEL1", "MODEL2"), required=True, help="Models to compare")
 
     args = parser.parse_args()
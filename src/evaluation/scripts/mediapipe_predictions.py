@@ -2,10 +2,10 @@
 
 import argparse
 import sys
-import jsonlines
 import mediapipe as mp
 from langcodes import Language
-from src.evaluation.scripts.eval_datasets import load_flores_data, load_udhr_data
+from src.evaluation.scripts.eval_datasets import DATASETS, get_dataset, load_dataset_examples
+from src.evaluation.scripts.jsonl_io import JsonlWriter
 
 
 def get_model_info(model_name):
@@ -47,14 +47,8 @@ def predict_languages(dataset, model_name, split=None):
     detector = mp_lang.LanguageDetection()
 
     # Load data based on dataset
-    if dataset == "flores":
-        if split is None:
-            raise ValueError("Split must be specified for FLORES+ dataset")
-        data = load_flores_data(split)
-    elif dataset == "udhr":
-        data = load_udhr_data()
-    else:
-        raise ValueError(f"Unknown dataset: {dataset}. Available datasets: flores, udhr")
+    text_field = get_dataset(dataset).text_field
+    data = load_dataset_examples(dataset, split)
 
     print(f"Processing {len(data)} examples...", file=sys.stderr)
     results = []
@@ -64,7 +58,7 @@ def predict_languages(dataset, model_name, split=None):
             print(f"Processed {i}/{len(data)} examples...", file=sys.stderr)
 
         # MediaPipe language detection
-        detection = detector.detect_language(example["text"])
+        detection = detector.detect_language(example[text_field])
 
         if detection.language_code:
             pred_lang = convert_to_three_letter(detection.language_code)
@@ -84,15 +78,14 @@ def predict_languages(dataset, model_name, split=None):
 
     print(f"Completed processing {len(results)} examples", file=sys.stderr)
 
-    with jsonlines.Writer(sys.stdout) as writer:
-        for result in results:
-            writer.write(result)
+    with JsonlWriter(sys.stdout) as writer:
+        writer.write_all(results)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run MediaPipe-based language identification predictions")
-    parser.add_argument("--dataset", choices=["flores", "udhr"], required=True,
-                       help="Dataset to process (flores or udhr)")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                       help="Dataset to process (see eval_datasets.DATASETS)")
     parser.add_argument("--model", choices=["mediapipe"], required=True,
                        help="Model to use (mediapipe)")
     parser.add_argument("--split", choices=["dev", "devtest"],
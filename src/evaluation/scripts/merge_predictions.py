@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
 import argparse
-import jsonlines
 import sys
 
+from jsonl_io import JsonlWriter, iter_jsonl
+
 
 def get_content_hash(example):
     items = {k: v for k, v in example.items() if k != 'predictions'}
@@ -11,11 +12,8 @@ def get_content_hash(example):
 
 
 def merge_predictions_files(input_files, output_file):
-    if output_file:
-        writer = jsonlines.open(output_file, 'w')
-    else:
-        writer = jsonlines.Writer(sys.stdout)
-    readers = [jsonlines.open(f) for f in input_files]
+    writer = JsonlWriter(output_file or sys.stdout)
+    readers = [iter_jsonl(f) for f in input_files]
 
     line_num = 0
     for examples in zip(*readers):
@@ -30,6 +28,7 @@ def merge_predictions_files(input_files, output_file):
             if example_key != reference_key:
                 print(f"ERROR: Content mismatch at line {line_num}")
                 print(f"File: {input_files[i]}")
+                writer.close()
                 exit(1)
 
             for model, prediction in example['predictions'].items():
@@ -38,10 +37,7 @@ def merge_predictions_files(input_files, output_file):
         writer.write(merged_example)
         line_num += 1
 
-    if output_file:
-        writer.close()
-    for reader in readers:
-        reader.close()
+    writer.close()
 
 
 if __name__ == "__main__":
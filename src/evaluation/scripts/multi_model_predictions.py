@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from eval_datasets import DATASETS
+from fasttext_predictions import (OPENLID_MODELS, add_model_arguments, add_run_arguments, cache_predictions, check_run_arguments, get_model_info,
+                                  load_model, resolve_model_path, run_predictions, warn_if_preprocessing_disabled)
+from lid_client import RemoteModel, served_model_name
+from prediction_cache import DEFAULT_MAX_ENTRIES, PredictionCache
+
+
+def predict_languages_multi(dataset, model_specs, split=None, languages_file=None, prediction_mode='before', enable_preprocessing=False,
+                            out_path="", threshold=None, ensemble_with_glotlid_k=0, batch_size=1, workers=1, glotlid_cache_dir=None,
+                            scores_path=None, scores_k=0, prediction_cache_path=None, prediction_cache_max_entries=DEFAULT_MAX_ENTRIES,
+                            matrix_dtype='float32', engine='fasttext', server=None, store_path=None, store_probs=False):
+    """Predict a dataset with several fastText models, reading and preprocessing every example once.
+
+    Preprocessing is only applied to the OpenLID models, as in run_fasttext_based.sh.
+    """
+    cache = PredictionCache(prediction_cache_path, prediction_cache_max_entries) if prediction_cache_path else None
+    models = []
+    for model_name, model_path in model_specs:
+        if server:
+            model = RemoteModel(server, served_model_name(model_name, languages_file is not None))
+        else:
+            model_path = resolve_model_path(model_name, model_path)
+            model = load_model(model_name, model_path, languages_file, prediction_mode, matrix_dtype, engine)
+        model_preprocessing = enable_preprocessing and model_name in OPENLID_MODELS
+        if cache is not None:
+            model = cache_predictions(model, cache, model_path, model_preprocessing, languages_file, prediction_mode, matrix_dtype, engine)
+        warn_if_preprocessing_disabled(model_name, model_preprocessing)
+        models.append((model_name, model, model_preprocessing))
+
+    run_predictions(dataset, split, models, out_path=out_path, threshold=threshold, ensemble_with_glotlid_k=ensemble_with_glotlid_k,
+                    batch_size=batch_size, workers=workers, glotlid_cache_dir=glotlid_cache_dir, scores_path=scores_path, scores_k=scores_k,
+                    store_path=store_path, store_probs=store_probs)
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several fastText-based language identification models in one pass")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                       help="Dataset to process (see eval_datasets.DATASETS)")
+    parser.add_argument("--model", nargs="+", metavar=("MODEL", "MODEL_PATH"), dest="models", action="append", required=True,
+                       help="Model to use, optionally followed by the path to a local model file (required for retrained); repeat for every model")
+    parser.add_argument("--split", choices=["dev", "devtest"],
+                       help="Data split to process (required for FLORES+ dataset)")
+    add_model_arguments(parser)
+    parser.add_argument("--enable-preprocessing", action="store_true",
+                       help="Enable text preprocessing for the OpenLID models (openlid, openlid-v2, retrained)")
+    parser.add_argument("--out_path", type=str, default="",
+                       help="Where to write the examples with merged predictions (default: print tab-separated labels)")
+    parser.add_argument("--store", type=str, dest="store_path",
+                       help="Also (or instead of --out_path) save the gold labels and a column of labels per model in this "
+                            "directory (see prediction_store.py)")
+    parser.add_argument("--store-probs", action="store_true",
+                       help="Also save the top probability of every model for every example in --store")
+    parser.add_argument("--scores-path", type=str,
+                       help="Also save the raw top-k labels and probabilities per example; <path>.<model>.npz for every model")
+    add_run_arguments(parser)
+    args = parser.parse_args()
+
+    model_specs = []
+    for spec in args.models:
+        if len(spec) > 2:
+            parser.error(f"--model takes a model name and an optional path, got {spec}")
+        model_name, model_path = spec[0], spec[1] if len(spec) == 2 else None
+        try:
+            get_model_info(model_name)
+        except ValueError as e:
+            parser.error(str(e))
+        if model_name in [name for name, _ in model_specs]:
+            parser.error(f"--model {model_name} given more than once")
+        model_specs.append((model_name, model_path))
+
+    if args.dataset == "flores" and args.split is None:
+        parser.error("--split is required when --dataset is flores")
+    check_run_arguments(parser, args)
+    if args.store_probs and not args.store_path:
+        parser.error("--store-probs requires --store")
+
+    predict_languages_multi(args.dataset, model_specs, args.split, args.languages_file, args.prediction_mode, args.enable_preprocessing,
+                            args.out_path, args.threshold, args.ensemble_with_glotlid_k, args.batch_size, args.workers, args.glotlid_cache_dir,
+                            args.scores_path, args.scores_k, args.prediction_cache_path, args.prediction_cache_max_entries, args.matrix_dtype,
+                            args.engine, args.server, args.store_path, args.store_probs)
@@ -4,9 +4,38 @@ NONWORD_REPLACE_STR = r"[^\p{Word}\p{Zs}]|\d"
 NONWORD_REPLACE_PAT = regex.compile(NONWORD_REPLACE_STR)
 SPACE_PAT = regex.compile(r"\s\s+")
 
+
 def clean_line(line):
-    """simple language-agnostic cleaning"""
+    """simple language-agnostic cleaning (reference implementation, see normalize)"""
     text = line.strip().replace("\n", " ").lower()  # remove whitespace, apply lowercase
     text = regex.sub(NONWORD_REPLACE_PAT, "", text)  # either (not a word nor a space) or (is digit)
     text = regex.sub(SPACE_PAT, " ", text)  # squeeze whitespace
-    return text
\ No newline at end of file
+    return text
+
+
+class _NonwordDeletionTable(dict):
+    """str.translate table mapping every code point matched by NONWORD_REPLACE_PAT to None.
+
+    Code points are classified with the regex once, on first sight, and then looked up in C.
+    """
+
+    def __missing__(self, codepoint):
+        value = None if NONWORD_REPLACE_PAT.match(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+NONWORD_DELETION_TABLE = _NonwordDeletionTable()
+
+
+def normalize(text):
+    """Same output as clean_line, but removes non-word characters in a single translate pass.
+
+    After the deletion only \\p{Word} and \\p{Zs} characters are left, so SPACE_PAT is the only regex pass.
+    """
+    text = text.replace("\n", " ").strip().lower().translate(NONWORD_DELETION_TABLE)
+    return SPACE_PAT.sub(" ", text)
+
+
+def normalize_batch(texts):
+    return [normalize(text) for text in texts]
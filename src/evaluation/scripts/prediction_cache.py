@@ -0,0 +1,182 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from fasttext_numpy import EXPORT_METADATA
+
+DEFAULT_MAX_ENTRIES = 10_000_000
+# stay below SQLite's limit on the number of host parameters in one statement
+SQLITE_MAX_PARAMS = 900
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def chunks(items, size=SQLITE_MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class PredictionCache:
+    """Persistent SQLite cache of raw top-k model predictions, keyed by namespace, k and input text.
+
+    The namespace identifies everything the prediction depends on besides the text: model file checksum,
+    preprocessing flag, inference engine and, for CustomLID, the restriction list, mode and output matrix precision. Every process opens its own
+    connection, so the cache can be used from forked workers; hit/miss counters live in shared memory.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = multiprocessing.Value("q", 0)
+        self.misses = multiprocessing.Value("q", 0)
+        self._connection = None
+        self._pid = None
+        self._inherited_connections = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key BLOB PRIMARY KEY, labels TEXT NOT NULL, probs BLOB NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS model_checksums (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha256 TEXT)"
+            )
+
+    @property
+    def connection(self):
+        # never use a connection inherited through fork; keep a reference so that the child does not close it either
+        if self._pid != os.getpid():
+            if self._connection is not None:
+                self._inherited_connections.append(self._connection)
+            self._connection = sqlite3.connect(self.path, timeout=600)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def model_checksum(self, model_path):
+        """sha256 of a model file, memoized in the cache by path, size and mtime."""
+        if os.path.isdir(model_path):
+            # an exported model predicts like the .bin it was exported from
+            with open(os.path.join(model_path, EXPORT_METADATA), encoding="utf-8") as f:
+                return json.load(f)["source_sha256"]
+        stat = os.stat(model_path)
+        path = os.path.abspath(model_path)
+        row = self.connection.execute(
+            "SELECT sha256 FROM model_checksums WHERE path = ? AND size = ? AND mtime = ?", (path, stat.st_size, stat.st_mtime)
+        ).fetchone()
+        if row:
+            return row[0]
+        print(f"Computing checksum of {model_path}...", file=sys.stderr)
+        checksum = file_sha256(model_path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO model_checksums VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime, checksum))
+        return checksum
+
+    def namespace(self, model_path, enable_preprocessing, languages_list=None, prediction_mode=None, matrix_dtype="float32",
+                  engine="fasttext"):
+        languages = "all"
+        if languages_list is not None:
+            languages = hashlib.sha256("\n".join(sorted(set(languages_list))).encode()).hexdigest()
+            languages += f"/{prediction_mode}"
+            # float32 keeps the namespace of caches written before reduced-precision matrices existed
+            if matrix_dtype != "float32":
+                languages += f"/{matrix_dtype}"
+        namespace = f"{self.model_checksum(model_path)}|preprocessing={int(enable_preprocessing)}|languages={languages}"
+        if engine != "fasttext":
+            namespace += f"|engine={engine}"
+        return namespace
+
+    @staticmethod
+    def key(namespace, k, text):
+        return hashlib.sha256(f"{namespace}\0{k}\0{text}".encode("utf-8", "surrogatepass")).digest()[:16]
+
+    def lookup(self, namespace, texts, k):
+        """Return the cached (labels, probs) of every text, or None where the cache has no entry."""
+        keys = [self.key(namespace, k, text) for text in texts]
+        found = {}
+        for keys_chunk in chunks(list(set(keys))):
+            rows = self.connection.execute(
+                f"SELECT key, labels, probs FROM predictions WHERE key IN ({','.join('?' * len(keys_chunk))})", keys_chunk
+            ).fetchall()
+            for key, labels, probs in rows:
+                found[key] = (tuple(labels.split("\t")), np.frombuffer(probs, dtype=np.float64))
+
+        with self.connection:
+            now = time.time()
+            for keys_chunk in chunks(list(found)):
+                self.connection.execute(
+                    f"UPDATE predictions SET last_used = ? WHERE key IN ({','.join('?' * len(keys_chunk))})", [now, *keys_chunk]
+                )
+        results = [found.get(key) for key in keys]
+        num_hits = sum(result is not None for result in results)
+        with self.hits.get_lock():
+            self.hits.value += num_hits
+        with self.misses.get_lock():
+            self.misses.value += len(results) - num_hits
+        return results
+
+    def store(self, namespace, texts, k, batch_labels, batch_probs):
+        now = time.time()
+        rows = [
+            (self.key(namespace, k, text), "\t".join(labels), np.asarray(probs, dtype=np.float64).tobytes(), now)
+            for text, labels, probs in zip(texts, batch_labels, batch_probs)
+        ]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)", rows)
+
+    def evict(self):
+        """Drop the least recently used entries above max_entries."""
+        num_entries = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        num_evicted = max(0, num_entries - self.max_entries)
+        if num_evicted:
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY last_used LIMIT ?)", (num_evicted,)
+                )
+        return num_entries - num_evicted, num_evicted
+
+    def close(self):
+        num_entries, num_evicted = self.evict()
+        total = self.hits.value + self.misses.value
+        print(f"Prediction cache {self.path}: {self.hits.value} hits, {self.misses.value} misses "
+              f"({self.hits.value / total if total else 0:.1%} hit rate), {num_entries} entries, {num_evicted} evicted", file=sys.stderr)
+        self.connection.close()
+        self._connection = None
+        self._pid = None
+
+
+class CachedModel:
+    """Wraps a model so that predict(texts, k) consults a PredictionCache and only predicts the misses."""
+
+    def __init__(self, model, cache, namespace, predict_fn):
+        self.model = model
+        self.cache = cache
+        self.namespace = namespace
+        self.predict_fn = predict_fn
+        self.restricted = getattr(model, "restricted", False)
+
+    def predict(self, texts, k=1):
+        results = self.cache.lookup(self.namespace, texts, k)
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            miss_labels, miss_probs = self.predict_fn(self.model, miss_texts, k)
+            self.cache.store(self.namespace, miss_texts, k, miss_labels, miss_probs)
+            for i, labels, probs in zip(misses, miss_labels, miss_probs):
+                results[i] = (tuple(labels), probs)
+        return [labels for labels, _ in results], [probs for _, probs in results]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+from array import array
+
+import numpy as np
+
+from eval_datasets import DATASETS, get_dataset
+from jsonl_io import iter_jsonl
+
+# the column of gold labels; the other columns are named after their model
+GOLD = "gold"
+INFO_FILE = "store.json"
+
+
+class LabelColumnWriter:
+    """Collects one label (and optionally a probability) per row and saves them as a compressed .npz file.
+
+    The file holds a label vocabulary ("labels"), the label index of every row ("indices", int16 unless there
+    are too many labels) and, if probabilities were added, their float32 values ("probs"), in dataset order.
+    """
+
+    def __init__(self):
+        self.label_to_index = {}
+        self.indices = array("i")
+        self.probs = array("f")
+
+    def add(self, labels, probs=None):
+        label_to_index = self.label_to_index
+        self.indices.extend(label_to_index.setdefault(label, len(label_to_index)) for label in labels)
+        if probs is not None:
+            self.probs.extend(probs)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def save(self, path):
+        vocabulary = list(self.label_to_index)
+        index_dtype = np.int16 if len(vocabulary) < np.iinfo(np.int16).max else np.int32
+        arrays = {"labels": np.array(vocabulary, dtype=str), "indices": np.frombuffer(self.indices, dtype=np.int32).astype(index_dtype)}
+        if self.probs:
+            arrays["probs"] = np.frombuffer(self.probs, dtype=np.float32)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+
+def is_store(path):
+    return os.path.isdir(path)
+
+
+def column_path(store_path, name):
+    return os.path.join(store_path, f"{name}.npz")
+
+
+def load_store_info(store_path):
+    with open(os.path.join(store_path, INFO_FILE)) as f:
+        return json.load(f)
+
+
+def init_store(store_path, dataset, split, num_rows):
+    """Create a store for the rows of a dataset, or check that an existing one holds the same rows."""
+    info = {"dataset": dataset, "split": split, "num_rows": num_rows}
+    if os.path.exists(os.path.join(store_path, INFO_FILE)):
+        existing = load_store_info(store_path)
+        if existing != info:
+            raise ValueError(f"{store_path} holds the rows of {existing}, not of {info}")
+        return
+    os.makedirs(store_path, exist_ok=True)
+    tmp_path = os.path.join(store_path, INFO_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp_path, os.path.join(store_path, INFO_FILE))
+
+
+def save_store(store_path, dataset, split, gold_writer, column_writers):
+    """Save the gold labels and the columns of several models ({name: LabelColumnWriter}) of a dataset's rows.
+
+    Models already in the store keep their columns unless they are saved again, so predictions of separate runs
+    end up side by side, as in a merged predictions file.
+    """
+    init_store(store_path, dataset, split, len(gold_writer))
+    gold_writer.save(column_path(store_path, GOLD))
+    for name, writer in column_writers.items():
+        if len(writer) != len(gold_writer):
+            raise ValueError(f"{name} has {len(writer)} predictions for {len(gold_writer)} rows")
+        writer.save(column_path(store_path, name))
+        print(f"Saved the predictions of {name} to {column_path(store_path, name)}", file=sys.stderr)
+
+
+def store_models(store_path):
+    return sorted(name.removesuffix(".npz") for name in os.listdir(store_path)
+                  if name.endswith(".npz") and not name.endswith(".tmp.npz") and name != f"{GOLD}.npz")
+
+
+def load_column(store_path, name, probs=False):
+    """Return the label vocabulary and the label index of every row of a column (and the probabilities, or None)."""
+    path = column_path(store_path, name)
+    if not os.path.exists(path):
+        raise ValueError(f"No {name} column in {store_path}; it has {', '.join([GOLD] + store_models(store_path))}")
+    with np.load(path) as column:
+        # only the arrays asked for are read from the file
+        labels, indices = column["labels"].tolist(), column["indices"]
+        if probs:
+            return labels, indices, column["probs"] if "probs" in column.files else None
+    return labels, indices
+
+
+def load_labels(store_path, name):
+    labels, indices = load_column(store_path, name)
+    return np.array(labels, dtype=object)[indices].tolist()
+
+
+def convert_jsonl(input_file, dataset, split, store_path):
+    """Save the gold labels and the predictions of every model in a (merged) predictions file to a store."""
+    info = get_dataset(dataset)
+    gold_writer = LabelColumnWriter()
+    column_writers = {}
+    for row, example in enumerate(iter_jsonl(input_file)):
+        gold_writer.add([info.label(example)])
+        for name, label in example["predictions"].items():
+            if name not in column_writers:
+                if row:
+                    raise ValueError(f"{input_file}: row {row} has predictions of {name}, earlier rows do not")
+                column_writers[name] = LabelColumnWriter()
+            column_writers[name].add([label])
+    save_store(store_path, dataset, split, gold_writer, column_writers)
+
+    input_size = os.path.getsize(input_file)
+    store_size = sum(os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path))
+    print(f"{input_file}: {input_size / 1e6:.1f} MB, {store_path}: {store_size / 1e6:.2f} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a (merged) predictions JSONL file to a columnar prediction store")
+    parser.add_argument("input_file", help="Predictions JSONL file with a predictions dict per example")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True, help="Dataset the predictions are of")
+    parser.add_argument("--split", choices=["dev", "devtest"])
+    parser.add_argument("--store", required=True, help="Directory to save the columns to")
+
+    args = parser.parse_args()
+
+    if args.dataset == "flores" and not args.split:
+        parser.error("--split is required for flores dataset")
+
+    convert_jsonl(args.input_file, args.dataset, args.split, args.store)
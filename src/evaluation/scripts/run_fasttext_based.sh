@@ -4,7 +4,7 @@ set -e
 
 if [ $# -eq 0 ]; then
     echo "Usage: $0 <model>"
-    echo "Available models: glotlid, openlid, openlid-v2, retrained, retrained-repl"
+    echo "Available models: glotlid, openlid, openlid-v2, retrained, retrained-repl, specific-{sca,hsb,fas,ara}, cascade"
     exit 1
 fi
 
@@ -24,6 +24,11 @@ elif [ "$MODEL" = "specific-fas" ] ; then
     ARGS="--model retrained --model-path /scratch/project_465002259/eurolid/cascade-data/fas/model.bin --enable-preprocessing"
 elif [ "$MODEL" = "specific-ara" ] ; then
     ARGS="--model retrained --model-path /scratch/project_465002259/eurolid/cascade-data/ara/model.bin --enable-preprocessing"
+elif [ "$MODEL" = "cascade" ] ; then
+    ARGS="--model retrained --model-path /scratch/project_465002259/OpenLID-v2/model.bin --enable-preprocessing --batch-size 1000"
+    for SPECIALIST in sca hsb fas ara; do
+        ARGS="$ARGS --cascade $SPECIALIST /scratch/project_465002259/eurolid/cascade-data/$SPECIALIST/model.bin language-lists/$SPECIALIST.txt"
+    done
 else
     ARGS="--model $MODEL"
 fi
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+set -e
+
+# Runs glotlid, openlid-v2 and retrained in one pass per dataset and writes merged predictions,
+# replacing run_fasttext_based.sh + gather_predictions.sh for the fastText-based models
+
+RETRAINED_PATH=${1:-/scratch/project_465002259/OpenLID-v2/model.bin}
+ARGS="--model glotlid --model openlid-v2 --model retrained $RETRAINED_PATH --enable-preprocessing --batch-size 1000 --workers ${SLURM_CPUS_PER_TASK:-1}"
+
+mkdir -p predictions
+
+echo "Running fastText-based models on flores plus dev"
+time python3 scripts/multi_model_predictions.py --dataset flores --split dev $ARGS --out_path predictions/fasttext.flores_plus_dev.jsonl
+
+echo "Running fastText-based models on flores plus devtest"
+time python3 scripts/multi_model_predictions.py --dataset flores --split devtest $ARGS --out_path predictions/fasttext.flores_plus_devtest.jsonl
+
+echo "Running fastText-based models on udhr"
+time python3 scripts/multi_model_predictions.py --dataset udhr $ARGS --out_path predictions/fasttext.udhr.jsonl
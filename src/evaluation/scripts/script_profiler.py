@@ -0,0 +1,57 @@
+import sys
+
+import numpy as np
+import regex
+
+# label scripts (ISO 15924) written with several Unicode scripts
+COMPOSITE_SCRIPTS = {
+    "Jpan": ["Hira", "Kana", "Hani"],
+    "Kore": ["Hang", "Hani"],
+    "Hans": ["Hani"],
+    "Hant": ["Hani"],
+    "Hanb": ["Hani", "Bopo"],
+}
+# codes for common, inherited, unwritten or unknown text; labels with these scripts are never gated
+NON_SCRIPT_CODES = {"Zinh", "Zmth", "Zsye", "Zsym", "Zxxx", "Zyyy", "Zzzz"}
+
+
+def label_script(label):
+    """ISO 15924 code a label ends with, e.g. Cyrl for __label__rus_Cyrl."""
+    return label.rsplit("_", 1)[-1]
+
+
+def unicode_scripts(script):
+    """Unicode scripts whose characters indicate a label script; empty for codes that are not scripts."""
+    if script in NON_SCRIPT_CODES:
+        return []
+    return COMPOSITE_SCRIPTS.get(script, [script])
+
+
+class ScriptProfiler:
+    """Counts the characters of every text of a batch per Unicode script.
+
+    A lookup table from code point to script index is built once for the given scripts (ISO 15924 codes);
+    characters of other scripts, and common or inherited ones such as digits, punctuation and combining marks,
+    are not counted. Unknown codes are dropped from `scripts`.
+    """
+
+    def __init__(self, scripts):
+        all_characters = "".join(map(chr, range(sys.maxunicode + 1)))
+        self.scripts = []
+        self.table = np.zeros(sys.maxunicode + 1, dtype=np.uint16)
+        for script in sorted(set(scripts)):
+            try:
+                pattern = regex.compile(rf"\p{{Script={script}}}+")
+            except regex.error:
+                continue
+            self.scripts.append(script)
+            for match in pattern.finditer(all_characters):
+                self.table[match.start():match.end()] = len(self.scripts)
+
+    def profile(self, texts):
+        """(len(texts), len(scripts)) array of character counts."""
+        num_scripts = len(self.scripts) + 1
+        codepoints = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        owners = np.repeat(np.arange(len(texts)), [len(text) for text in texts])
+        counts = np.bincount(owners * num_scripts + self.table[codepoints], minlength=len(texts) * num_scripts)
+        return counts.reshape(len(texts), num_scripts)[:, 1:]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+import numpy as np
+from eval_datasets import DATASETS, dataset_file, iter_jsonl
+from evaluate import ConfusionMatrix, calculate_metrics, compute_macro_averages, encode, extract_language, load_languages_file, new_label_index
+from glotlid_cache import load_glotlid_top_k
+from topk_scores import PADDING, is_restricted, load_top_k
+
+UNDETERMINED = "zxx_Zxxx"
+
+
+def sweep_thresholds(scores_path, dataset, split, languages_file, thresholds, ensemble_ks, glotlid_cache_dir=None):
+    """Evaluate threshold and GlotLID ensemble settings on stored top-k scores, without running the model.
+
+    Applies the same rules as fasttext_predictions.resolve_label: the top-1 label is kept if its probability
+    is above the threshold (0 disables thresholding) and, with ensemble k > 0, if it is among GlotLID's top k.
+    Scores of a restricted model are swept as such a model is run: always with its top-1 label, so every
+    setting gives the same results. The gold and candidate labels are encoded once; every setting only selects predicted label codes.
+    """
+    dataset_path, text_field = dataset_file(dataset, split)
+    golds = [extract_language(example, dataset) for example in iter_jsonl(dataset_path)]
+    allowed_languages = load_languages_file(languages_file)
+
+    labels, indices, probs = load_top_k(scores_path)
+    if len(indices) != len(golds):
+        raise ValueError(f"{scores_path} has {len(indices)} rows but {dataset_path} has {len(golds)} examples")
+    restricted = is_restricted(scores_path)
+    if restricted:
+        print(f"{scores_path} holds the scores of a restricted model, which ignores thresholds and the ensemble: "
+              f"all settings give the same results", file=sys.stderr)
+
+    # one label space for the model, GlotLID and the undetermined label
+    vocabulary = labels + [UNDETERMINED]
+    undetermined_id = len(labels)
+    # a row without any label (all padding) is undetermined, whatever the threshold
+    top1 = np.where(indices[:, 0] == PADDING, undetermined_id, indices[:, 0]).astype(np.int64)
+    top1_probs = probs[:, 0]
+
+    max_ensemble_k = 0 if restricted else max(ensemble_ks)
+    glotlid_ids = None
+    if max_ensemble_k:
+        if glotlid_cache_dir is None:
+            raise ValueError("Sweeping ensemble k > 0 needs --glotlid-cache-dir")
+        glotlid = load_glotlid_top_k(dataset_path, text_field, max_ensemble_k, glotlid_cache_dir)
+        label_to_id = {label: i for i, label in enumerate(vocabulary)}
+        for label in glotlid.labels:
+            label_to_id.setdefault(label, len(label_to_id))
+        # padding is mapped to PADDING, which never equals a top-1 label
+        glotlid_ids = np.array([label_to_id[label] for label in glotlid.labels] + [PADDING], dtype=np.int64)[glotlid.indices]
+
+    # golds are numbered first, as evaluate.encode_labels does, so the languages are averaged in the same order
+    label_index = new_label_index()
+    gold_codes = encode(label_index, golds)
+    vocabulary_codes = encode(label_index, vocabulary)
+    eval_labels = list(label_index)
+    curves = []
+    for ensemble_k in ensemble_ks:
+        in_glotlid = np.ones(len(top1), dtype=bool)
+        if ensemble_k and not restricted:
+            in_glotlid = (glotlid_ids[:, :ensemble_k] == top1[:, None]).any(axis=1)
+        for threshold in thresholds:
+            keep = in_glotlid & (top1_probs > threshold) if threshold and not restricted else in_glotlid
+            pred_codes = vocabulary_codes[np.where(keep, top1, undetermined_id)]
+            cm = ConfusionMatrix.from_codes(eval_labels, gold_codes, pred_codes)
+            macro_averages = compute_macro_averages(calculate_metrics(cm, allowed_languages))
+            curves.append({"threshold": threshold, "ensemble_k": ensemble_k, **macro_averages})
+            print(f"threshold {threshold}, ensemble k {ensemble_k}: f1 {macro_averages['f1']:.4f}, fpr {macro_averages['fpr']:.6f}",
+                  file=sys.stderr)
+
+    json.dump({"scores": scores_path, "restricted": restricted, "curves": curves}, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep softmax thresholds and GlotLID ensemble k on stored top-k scores")
+    parser.add_argument("scores_path", help="Top-k scores saved with fasttext_predictions.py --scores-path")
+    parser.add_argument("--dataset", choices=list(DATASETS), required=True,
+                       help="Dataset the scores were predicted on (see eval_datasets.DATASETS)")
+    parser.add_argument("--split", choices=["dev", "devtest"],
+                       help="Data split (required for FLORES+ dataset)")
+    parser.add_argument("--languages-file", required=True, help="File containing list of languages to restrict evaluation to (one per line)")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[round(0.05 * i, 2) for i in range(20)],
+                       help="Thresholds to evaluate; 0 means no thresholding")
+    parser.add_argument("--ensemble-k", nargs="+", type=int, default=[0], dest="ensemble_ks",
+                       help="GlotLID ensemble k values to evaluate; 0 means no ensemble")
+    parser.add_argument("--glotlid-cache-dir", type=str,
+                       help="Directory with the GlotLID top-k cache of the dataset (see glotlid_cache.py)")
+
+    args = parser.parse_args()
+
+    if args.dataset == "flores" and args.split is None:
+        parser.error("--split is required when --dataset is flores")
+
+    sweep_thresholds(args.scores_path, args.dataset, args.split, args.languages_file, args.thresholds, args.ensemble_ks,
+                     args.glotlid_cache_dir)
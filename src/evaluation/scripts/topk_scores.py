@@ -0,0 +1,65 @@
+import os
+from array import array
+
+import numpy as np
+
+FASTTEXT_PREFIX = "__label__"
+# label index of the slots of rows with fewer than k labels (a model or specialist with fewer labels than k)
+PADDING = -1
+
+
+class TopKScoresWriter:
+    """Collects per-example top-k labels and probabilities and saves them as a compact .npz file.
+
+    The file holds a label vocabulary ("labels") and (rows, k) arrays of label indices ("indices")
+    and float32 probabilities ("probs"), in dataset order. Rows with fewer than k labels are padded
+    with index PADDING and probability 0. "restricted" records whether the scores come from a restricted
+    (CustomLID) model, whose predictions ignore thresholds and the GlotLID ensemble.
+    """
+
+    def __init__(self, k, restricted=False):
+        self.k = k
+        self.restricted = restricted
+        self.label_to_index = {}
+        # flat buffers of k slots per row, reshaped when saved
+        self.indices = array("i")
+        self.probs = array("f")
+
+    def add(self, batch_labels, batch_probs):
+        label_to_index = self.label_to_index
+        for text_labels, text_probs in zip(batch_labels, batch_probs):
+            self.indices.extend(label_to_index.setdefault(label.removeprefix(FASTTEXT_PREFIX), len(label_to_index))
+                                for label in text_labels)
+            self.probs.frombytes(np.asarray(text_probs, dtype=np.float32).tobytes())
+            padding = self.k - len(text_labels)
+            if padding:
+                self.indices.extend([PADDING] * padding)
+                self.probs.extend([0.0] * padding)
+
+    def __len__(self):
+        return len(self.indices) // self.k
+
+    def save(self, path):
+        vocabulary = list(self.label_to_index)
+        index_dtype = np.int16 if len(vocabulary) < np.iinfo(np.int16).max else np.int32
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, labels=np.array(vocabulary),
+                 indices=np.frombuffer(self.indices, dtype=np.int32).astype(index_dtype).reshape(-1, self.k),
+                 probs=np.frombuffer(self.probs, dtype=np.float32).reshape(-1, self.k), restricted=self.restricted)
+        os.replace(tmp_path, path)
+
+
+def load_top_k(path):
+    """Return the label vocabulary, (rows, k) label indices and probabilities saved by TopKScoresWriter.
+
+    Slots past the labels of a row have index PADDING and probability 0.
+    """
+    with np.load(path) as scores:
+        return scores["labels"].tolist(), scores["indices"], scores["probs"]
+
+
+def is_restricted(path):
+    """Whether the scores saved by TopKScoresWriter come from a restricted model (False for files saved without the flag)."""
+    with np.load(path) as scores:
+        return "restricted" in scores.files and bool(scores["restricted"])